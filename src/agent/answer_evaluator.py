@@ -1,10 +1,8 @@
-from functools import lru_cache
 import json
 from typing import List, Dict
 import pandas as pd
 from src.agent.prompts import EVALUATE_ANSWER_SYSTEM_PROMPT, EVALUATE_ANSWER_USER_PROMPT
-from src.utils.constants import CHAT_DEPLOYMENT_NAME, AZURE_OPENAI_ENDPOINT, API_VERSION
-from src.utils.LLM_utils import SystemMessage, HumanMessage, LoggingAzureChatOpenAI
+from src.utils.LLM_utils import SystemMessage, HumanMessage, LoggingAzureChatOpenAI, get_chat_model
 from src.utils.helper_function import json_parser
 from src.data.index_and_search import get_db_object, index_df
 
@@ -13,17 +11,9 @@ COMMON_MISTAKES_COLLECTION = "common_mistakes"
 COMMON_MISTAKES_ID_COL = "question_description"  # used as the unique ID in this collection
 
 
-@lru_cache(maxsize=1)
 def get_model() -> LoggingAzureChatOpenAI:
     """Return a cached Chat LLM for the Answer Evaluator (temperature=0 for determinism)."""
-    return LoggingAzureChatOpenAI(
-        agent_name="ANSWER_EVALUATOR",
-        azure_deployment=CHAT_DEPLOYMENT_NAME,
-        azure_endpoint=AZURE_OPENAI_ENDPOINT,
-        openai_api_version=API_VERSION,
-        openai_api_type="azure",
-        temperature=0,
-    )
+    return get_chat_model("ANSWER_EVALUATOR")
 
 
 def _dedupe(seq: List[str]) -> List[str]:
@@ -1,25 +1,18 @@
 # src/agent/coacher.py
-from functools import lru_cache
 from pydantic import BaseModel, Field
 from langchain.tools import StructuredTool
 from src.agent.prompts import COACHER_SYSTEM_PROMPT, COACHER_USER_PROMPT
-from src.utils.LLM_utils import SystemMessage, HumanMessage, LoggingAzureChatOpenAI
-from src.utils.constants import CHAT_DEPLOYMENT_NAME, AZURE_OPENAI_ENDPOINT, API_VERSION
+from src.utils.LLM_utils import SystemMessage, HumanMessage, LoggingAzureChatOpenAI, get_chat_model
+from src.utils.constants import LLM_STREAMING_ENABLED
+from src.utils.user_response import display_message
+from src.utils.token_quota import is_quota_degraded
 
 
-@lru_cache(maxsize=1)
 def get_model() -> LoggingAzureChatOpenAI:
     """
     Return a cached Chat LLM for the Coacher tool (temperature=0 for stable phrasing).
     """
-    return LoggingAzureChatOpenAI(
-        agent_name="COACHER",
-        azure_deployment=CHAT_DEPLOYMENT_NAME,
-        azure_endpoint=AZURE_OPENAI_ENDPOINT,
-        openai_api_version=API_VERSION,
-        openai_api_type="azure",
-        temperature=0,
-    )
+    return get_chat_model("COACHER")
 
 
 def get_coacher_response(student_state: str) -> str:
@@ -37,13 +30,21 @@ def get_coacher_response(student_state: str) -> str:
     str
         Approval that the coacher message was printed.
     """
+    if is_quota_degraded():
+        # the motivational message is the first thing to go when the lesson is close to its token quota
+        return "coacher skipped (token quota), proceed to another question or continue guiding the student"
+
     messages = [
         SystemMessage(content=COACHER_SYSTEM_PROMPT),
         HumanMessage(content=COACHER_USER_PROMPT.format(student_state=student_state)),
     ]
-    resp = get_model()(messages)
-    message = getattr(resp, "content", str(resp)).strip()
-    print(f"\n\n💖🤖 AI Teacher: {message}")
+    if LLM_STREAMING_ENABLED:
+        # the student sees the message as it is generated
+        display_message(get_model().stream_tokens(messages), header="💖🤖 AI Teacher:")
+    else:
+        resp = get_model()(messages)
+        message = getattr(resp, "content", str(resp)).strip()
+        print(f"\n\n💖🤖 AI Teacher: {message}")
     return "coacher message was printed, now proceed to another question or continue guiding the student solving the current question if needed"
 
 
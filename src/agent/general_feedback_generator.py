@@ -1,23 +1,14 @@
-from functools import lru_cache
 
 from src.agent.prompts import FINAL_FEEDBACK_SYSTEM_PROMPT, FINAL_FEEDBACK_USER_PROMPT
-from src.utils.constants import CHAT_DEPLOYMENT_NAME, AZURE_OPENAI_ENDPOINT, API_VERSION
 from src.utils.LLM_utils import SystemMessage, HumanMessage
-from src.utils.LLM_utils import LoggingAzureChatOpenAI
+from src.utils.LLM_utils import get_chat_model
+from src.utils.constants import LLM_STREAMING_ENABLED
+from src.utils.user_response import display_message
 from src.agent.student_evaluator import update_student_course_status
 
 
-@lru_cache(maxsize=1)
 def get_model():
-    llm = LoggingAzureChatOpenAI(
-        agent_name="FINAL_FEEDBACK",
-        azure_deployment=CHAT_DEPLOYMENT_NAME,
-        azure_endpoint=AZURE_OPENAI_ENDPOINT,
-        openai_api_version=API_VERSION,
-        openai_api_type="azure",
-        temperature=0,
-    )
-    return llm
+    return get_chat_model("FINAL_FEEDBACK")
 
 
 def provide_final_feedback(session_summary:str=None, student_id:str=None, course:str=None, **kwargs):
@@ -45,10 +36,14 @@ def provide_final_feedback(session_summary:str=None, student_id:str=None, course
         ))
     ]
 
-    response = llm(messages)
-    feedback_session = response.content
-    print("\n\n✅🤖 AI Teacher Feedback:\t")
-    print(str(feedback_session).replace("\\n", "\n"))
+    if LLM_STREAMING_ENABLED:
+        # the student sees the feedback as it is generated
+        feedback_session = display_message(llm.stream_tokens(messages), header="✅🤖 AI Teacher Feedback:\t")
+    else:
+        response = llm(messages)
+        feedback_session = response.content
+        print("\n\n✅🤖 AI Teacher Feedback:\t")
+        print(str(feedback_session).replace("\\n", "\n"))
     update_student_course_status(student_id, course, feedback_session)
 
     return feedback_session
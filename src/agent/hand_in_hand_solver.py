@@ -1,25 +1,16 @@
-from functools import cached_property, lru_cache
+from functools import cached_property
 
 from src.agent.prompts import INITIALIZE_HAND_IN_HAND_SYSTEM_PROMPT, INITIALIZE_HAND_IN_HAND_USER_PROMPT
-from src.utils.constants import CHAT_DEPLOYMENT_NAME, AZURE_OPENAI_ENDPOINT, API_VERSION, DEBUG_MODE
-from src.utils.LLM_utils import LoggingAzureChatOpenAI
+from src.utils.constants import DEBUG_MODE
+from src.utils.LLM_utils import get_chat_model, build_prompt, PromptSection
 from src.data.index_and_search import get_db_object
 from langchain.agents import initialize_agent, Tool
 from langchain.agents.agent_types import AgentType
 from src.agent.answer_evaluator import evaluate_answer
 
 
-@lru_cache(maxsize=1)
 def get_model():
-    llm = LoggingAzureChatOpenAI(
-        agent_name="HAND_IN_HAND",
-        azure_deployment=CHAT_DEPLOYMENT_NAME,
-        azure_endpoint=AZURE_OPENAI_ENDPOINT,
-        openai_api_version=API_VERSION,
-        openai_api_type="azure",
-        temperature=0,
-    )
-    return llm
+    return get_chat_model("HAND_IN_HAND")
 
 
 def get_student_answer(question: str):
@@ -143,13 +134,16 @@ def hand_in_hand_agent(course: str = None, question: str = None, solution: str =
         verbose=DEBUG_MODE,
     )
 
-    prompt = INITIALIZE_HAND_IN_HAND_SYSTEM_PROMPT + "\n" + \
-             INITIALIZE_HAND_IN_HAND_USER_PROMPT.format(
-                 course=course,
-                 question=question,
-                 reference_solution=solution,
-                 student_answer=student_answer
-             )
+    # over the token budget, long reference solutions are trimmed first, then the student's answer
+    prompt = build_prompt(
+        "HAND_IN_HAND",
+        INITIALIZE_HAND_IN_HAND_USER_PROMPT,
+        prefix=INITIALIZE_HAND_IN_HAND_SYSTEM_PROMPT + "\n",
+        course=course,
+        question=question,
+        reference_solution=PromptSection(solution, priority=2),
+        student_answer=PromptSection(student_answer, priority=1),
+    )
 
     response = agent.run(prompt)
     return response
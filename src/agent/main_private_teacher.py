@@ -1,9 +1,8 @@
 # src/agent/main_private_teacher.py
 
 from dotenv import load_dotenv
-from functools import lru_cache
-from src.utils.constants import CHAT_DEPLOYMENT_NAME, AZURE_OPENAI_ENDPOINT, API_VERSION, DEBUG_MODE
-from src.utils.LLM_utils import LoggingAzureChatOpenAI
+from src.utils.constants import DEBUG_MODE
+from src.utils.LLM_utils import LoggingAzureChatOpenAI, get_chat_model, build_prompt, PromptSection
 
 from langchain.agents import initialize_agent, Tool
 from langchain.agents.agent_types import AgentType
@@ -16,7 +15,7 @@ from src.agent.prompts import (
     INITIALIZE_MAIN_PRIVATE_TEACHER_USER_PROMPT
 )
 from src.utils.user_response import present_message_to_user
-from src.agent.student_evaluator import get_student_course_status
+from src.agent.student_evaluator import get_student_course_summary
 from src.agent.general_feedback_generator import provide_final_feedback
 
 load_dotenv()
@@ -24,16 +23,8 @@ load_dotenv()
 # -------------------------------------
 # LLM factory (cached; temperature=0 for stability)
 # -------------------------------------
-@lru_cache(maxsize=1)
 def get_model() -> LoggingAzureChatOpenAI:
-    return LoggingAzureChatOpenAI(
-        agent_name="MAIN_PRIVATE_AGENT",
-        azure_deployment=CHAT_DEPLOYMENT_NAME,
-        azure_endpoint=AZURE_OPENAI_ENDPOINT,
-        openai_api_version=API_VERSION,
-        openai_api_type="azure",
-        temperature=0,
-    )
+    return get_chat_model("MAIN_PRIVATE_AGENT")
 
 # Define tools
 tools = [
@@ -93,7 +84,7 @@ tools = [
 
 # Create ReAct agent
 def init_private_teacher(student_id, course, user_message):
-    student_evaluation_notes = get_student_course_status(student_id, course)
+    student_evaluation_notes = get_student_course_summary(student_id, course)
 
     agent = initialize_agent(
         tools=tools,
@@ -103,12 +94,15 @@ def init_private_teacher(student_id, course, user_message):
         handle_parsing_errors=True,       # more resilient formatting
     )
 
-    prompt = INITIALIZE_MAIN_PRIVATE_TEACHER_SYSTEM_PROMPT + "\n" + \
-            INITIALIZE_MAIN_PRIVATE_TEACHER_USER_PROMPT.format(
-            student_id=student_id,
-            course=course,
-            user_message=user_message,
-            student_evaluation_notes=student_evaluation_notes
-        )
+    # the student notes are trimmed first if the prompt exceeds the agent's token budget
+    prompt = build_prompt(
+        "MAIN_PRIVATE_AGENT",
+        INITIALIZE_MAIN_PRIVATE_TEACHER_USER_PROMPT,
+        prefix=INITIALIZE_MAIN_PRIVATE_TEACHER_SYSTEM_PROMPT + "\n",
+        student_id=student_id,
+        course=course,
+        user_message=PromptSection(user_message, priority=1),
+        student_evaluation_notes=PromptSection(student_evaluation_notes, priority=2),
+    )
     
     return agent, prompt
@@ -152,6 +152,8 @@ Goal:
 
 Tool policy:
 1) You MUST call the tool "Search_in_DB" FIRST (exactly once) to retrieve candidate material.
+    When the request or the Notes name a topic or a difficulty, pass them as filters:
+    {{"query": "<short search query>", "topic": "<topic>", "difficulty": "<easy|medium|hard>"}}
 2) AFTER reading the DB results:
     - If sufficient, generate the final answer and STOP.
     - If insufficient or off-topic, you MAY call "Search_in_Web" AT MOST ONCE.
@@ -280,7 +282,8 @@ Feedback from latest session:
 Output a JSON object with exactly these keys:
 {{
     "score": <integer 0–100>,
-    "note": "<short summary of current mastery and focus areas>"
+    "note": "<short summary of current mastery and focus areas>",
+    "weak_topics": ["<short topic name the student struggled with>", ...]
 }}
 """
 
@@ -1,8 +1,10 @@
-from functools import lru_cache
+from functools import lru_cache, partial
+import json
 
 from langchain_community.tools import DuckDuckGoSearchRun
 from langchain.agents import initialize_agent, Tool
 from langchain.agents.agent_types import AgentType
+from loguru import logger
 
 from src.agent.prompts import (
     GET_QUERY_TO_SEARCH_SYSTEM_PROMPT,
@@ -13,27 +15,24 @@ from src.agent.prompts import (
     INFER_course_USER_PROMPT,
     course_GUIDELINES_PROMPTS_DICT,
 )
-from src.utils.constants import CHAT_DEPLOYMENT_NAME, AZURE_OPENAI_ENDPOINT, API_VERSION, DEBUG_MODE
+from src.utils.constants import (
+    DEBUG_MODE, USE_UNIFIED_QUESTIONS_COLLECTION
+)
 from src.utils.LLM_utils import SystemMessage, HumanMessage
-from src.utils.LLM_utils import LoggingAzureChatOpenAI
-from src.data.index_and_search import get_db_object, COURSE_TO_COLLECTION_NAME
-from src.agent.student_evaluator import get_student_course_status
+from src.utils.LLM_utils import LoggingAzureChatOpenAI, get_chat_model, build_prompt, PromptSection
+from src.data.index_and_search import (
+    get_db_object, COURSE_TO_COLLECTION_NAME, COURSE_TO_FILTER_FIELDS, UNIFIED_QUESTIONS_COLLECTION
+)
+from src.agent.student_evaluator import get_student_course_summary
 from src.utils.helper_function import json_parser
+from src.utils.token_quota import is_quota_degraded
 
 
 # -------------------------------------
 # LLM factory (cached; temperature=0 for stability)
 # -------------------------------------
-@lru_cache(maxsize=1)
 def get_model() -> LoggingAzureChatOpenAI:
-    return LoggingAzureChatOpenAI(
-        agent_name="GENERATE_QUESTION",
-        azure_deployment=CHAT_DEPLOYMENT_NAME,
-        azure_endpoint=AZURE_OPENAI_ENDPOINT,
-        openai_api_version=API_VERSION,
-        openai_api_type="azure",
-        temperature=0,
-    )
+    return get_chat_model("GENERATE_QUESTION")
 
 
 # -------------------------------------
@@ -53,10 +52,20 @@ def _call(llm: LoggingAzureChatOpenAI, sys: str, user: str) -> str:
     # If your class returns a dict/string, adapt here:
     return getattr(resp, "content", str(resp))
 
+# Payload fields that are not needed for generating a question (long texts cost prompt tokens)
+REDUNDANT_DATA_FIELDS = ["question_description", "question_uid", "source"]
+COURSE_TO_EXCLUDED_FIELDS = {
+    'Math': REDUNDANT_DATA_FIELDS,
+    'Science': REDUNDANT_DATA_FIELDS + ["lecture"],
+    'History': REDUNDANT_DATA_FIELDS + ["context"],
+    'SAT': REDUNDANT_DATA_FIELDS,
+}
+
 def _remove_redundant_data_fields(docs):
-    if 'question_description' in docs:
-        # remove question description
-        [doc.pop('question_description') for doc in docs]
+    # remove question description (and other redundant fields) from each doc
+    for doc in docs:
+        for field in REDUNDANT_DATA_FIELDS:
+            doc.pop(field, None)
     return docs
 
 # -------------------------------------
@@ -96,44 +105,147 @@ def get_query_to_search(request: str, course: str) -> str:
 # -------------------------------------
 # DB search tool (must be used first by the agent)
 # -------------------------------------
-def search_in_DB(request: str) -> str:
+# Payload fields the DB search can be narrowed on (indexed in the unified questions collection)
+QUESTION_FILTER_FIELDS = ("topic", "module", "difficulty")
+
+
+def search_in_DB(request: str, course: str = None) -> str:
     """
     Search for relevant documents in the database based on the user request.
     Input: 
-        - User request (str)
+        - User request (str): free text, or a JSON object {"query": ..., "topic": ..., "module": ...,
+          "difficulty": ..., "course": ...} - then the query is searched as is (no query-rewriting LLM call),
+          narrowed by the given payload filters (a list value matches any of its values)
+        - Course (str, optional) - inferred from the request by the LLM if not given
     Returns:
         JSON string: [{"doc_id": "...", "snippet": "...", "metadata": {...}}, ...]
     """
-    course = infer_course_from_request(request)
-    collection_name = COURSE_TO_COLLECTION_NAME[course]
+    structured = _parse_structured_request(request)
+    if structured is not None:
+        course = structured.get("course") if structured.get("course") in COURSE_TO_COLLECTION_NAME else course
+        if course not in COURSE_TO_COLLECTION_NAME:
+            course = infer_course_from_request(structured["query"])
+        filters = _question_filters(structured, course)
+        return str(_search_questions(structured["query"], course, top_k=2, filters=filters))
+
+    if course not in COURSE_TO_COLLECTION_NAME:
+        course = infer_course_from_request(request)
     query_to_search = get_query_to_search(request, course)
+    return str(_search_questions(query_to_search, course, top_k=2))
+
+
+def _parse_structured_request(request: str):
+    """The {"query": ..., <filters>} object of a structured DB search request, or None for free text."""
+    try:
+        parsed = json.loads(request)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(parsed, dict) or not parsed.get("query"):
+        return None
+    return parsed
+
+
+def _question_filters(structured: dict, course: str) -> dict:
+    """
+    The request's filters the course's questions have (see COURSE_TO_FILTER_FIELDS), lowercased as stored.
+    Filters on fields the course does not have would match nothing, so they are dropped.
+    """
+    filters = {}
+    for field in QUESTION_FILTER_FIELDS:
+        value = structured.get(field)
+        if not value:
+            continue
+        if field not in COURSE_TO_FILTER_FIELDS[course]:
+            logger.debug(f"{course} questions have no '{field}' to filter on, ignoring {field}={value!r}.")
+            continue
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        values = [str(v).strip().lower() for v in values]
+        filters[field] = values if isinstance(value, (list, tuple, set)) else values[0]
+    return filters
+
+
+def _search_questions(query: str, course: str, top_k: int, filters: dict = None):
+    """
+    Semantic search of the course's questions.
+    :param filters: optional {field: value} filters on QUESTION_FILTER_FIELDS; only the unified collection has
+        these (normalized, indexed) fields, so they are ignored when searching the per-course collections.
+        If nothing matches them, the search is run again without them.
+    """
+    if USE_UNIFIED_QUESTIONS_COLLECTION:
+        docs = get_db_object().search_by_query_vec(
+            collection_name=UNIFIED_QUESTIONS_COLLECTION,
+            query=query,
+            top_k=top_k,
+            filters={**(filters or {}), "course": course},
+            exclude_fields=COURSE_TO_EXCLUDED_FIELDS[course],
+        )
+        if not docs and filters:
+            logger.debug(f"No {course} question matches {filters}, searching without them.")
+            return _search_questions(query, course, top_k)
+    else:
+        if filters:
+            logger.debug(f"Per-course collections cannot be filtered by {list(filters)}, searching without filters.")
+        docs = get_db_object().search_by_query_vec(
+            collection_name=COURSE_TO_COLLECTION_NAME[course],
+            query=query,
+            top_k=top_k,
+            exclude_fields=COURSE_TO_EXCLUDED_FIELDS[course],
+        )
+    return _remove_redundant_data_fields(docs)
 
-    docs = get_db_object().search_by_query_vec(
-        collection_name=collection_name,
-        query=query_to_search,
-        top_k=2,
-    )
-    docs = _remove_redundant_data_fields(docs)
-    return str(docs)
+
+def get_stored_question(student_topic: str, course: str) -> str:
+    """
+    Cheap path used close to the token quota: the stored question closest to the student's topic,
+    found without any LLM call (no course inference, no query rewriting, no ReAct loop).
+    """
+    docs = _search_questions(student_topic, course, top_k=1)
+    if not docs:
+        return json.dumps({"course": course, "error": "No stored question found."})
+    doc = dict(docs[0])
+    question = doc.pop("question", None)
+    solution = doc.pop("solution", None) or doc.pop("answer", None)
+    return json.dumps({
+        "course": course,
+        "question": question if question is not None else doc,
+        "solution": solution,
+        "source": "db",
+        "provenance": "stored question (token quota)",
+        **({"details": doc} if question is not None and doc else {}),
+    }, ensure_ascii=False, default=str)
 
 
 # -------------------------------------
 # Web search tool (fallback)
 # -------------------------------------
-_ddg = DuckDuckGoSearchRun()
-tools = [
-    Tool(
-        name="Search_in_DB",
-        func=search_in_DB,
-        description=("Use this FIRST (exactly once). Retrieves candidate materials from our internal DB "
-                    "as a JSON string of short snippets. Prefer questions derived from these snippets.")
-    ),
-    Tool(
-        name="Search_in_Web",
-        func=_ddg.run,
-        description="Use ONLY if DB results are insufficient or off-topic. Call at most once."
-    ),
-]
+@lru_cache(maxsize=1)
+def get_web_search() -> DuckDuckGoSearchRun:
+    """Return a cached web search tool (created on first use, not at import)."""
+    return DuckDuckGoSearchRun()
+
+
+def search_in_web(query: str) -> str:
+    return get_web_search().run(query)
+
+
+def get_tools(course: str = None):
+    """Tools for the question agent; when the course is known the DB search skips the course inference."""
+    return [
+        Tool(
+            name="Search_in_DB",
+            func=partial(search_in_DB, course=course),
+            description=("Use this FIRST (exactly once). Retrieves candidate materials from our internal DB "
+                        "as a JSON string of short snippets. Prefer questions derived from these snippets. "
+                        "Input: the request as text, or a JSON object with a short search \"query\" and optional "
+                        "\"topic\", \"module\" and \"difficulty\" filters, "
+                        "e.g. {\"query\": \"solve linear equations\", \"topic\": \"algebra\", \"difficulty\": \"hard\"}.")
+        ),
+        Tool(
+            name="Search_in_Web",
+            func=search_in_web,
+            description="Use ONLY if DB results are insufficient or off-topic. Call at most once."
+        ),
+    ]
 
 # -------------------------------------
 # Agent entry point
@@ -169,7 +281,10 @@ def generate_question_agent(student_topic: str=None , student_id: str=None, cour
     student_id = input_params["student_id"]
     course = input_params["course"]
 
-    student_evaluation_notes = get_student_course_status(student_id, course)
+    if is_quota_degraded() and course in COURSE_TO_COLLECTION_NAME:
+        return get_stored_question(student_topic, course)
+
+    student_evaluation_notes = get_student_course_summary(student_id, course)
     if "error" not in student_evaluation_notes:
         if DEBUG_MODE:
             to_print = str(student_evaluation_notes).replace('\\n', '\n')
@@ -180,14 +295,16 @@ def generate_question_agent(student_topic: str=None , student_id: str=None, cour
         request = f"Request:\n{student_topic}"
 
     # ReAct agents expect a single prompt string; we concatenate system + user parts.
-    prompt_text = (
-        GENERATE_QUESTION_SYSTEM_PROMPT.strip()
-        + "\n\n"
-        + GENERATE_QUESTION_USER_PROMPT.format(request=request).strip()
+    # Over the token budget, the end of the request (the evaluation notes) is trimmed.
+    prompt_text = build_prompt(
+        "GENERATE_QUESTION",
+        GENERATE_QUESTION_USER_PROMPT.strip(),
+        prefix=GENERATE_QUESTION_SYSTEM_PROMPT.strip() + "\n\n",
+        request=PromptSection(request, priority=1),
     )
 
     agent = initialize_agent(
-        tools=tools,
+        tools=get_tools(course),
         llm=get_model(),
         agent=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
         verbose=DEBUG_MODE,
@@ -1,31 +1,560 @@
 from datetime import datetime
-from functools import lru_cache
-from typing import Dict, Any
-import pandas as pd
-import numpy as np
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+import json
+import sqlite3
+import threading
+import time
+import uuid
 from src.agent.prompts import (
     UPDATE_STUDENT_STATUS_SYSTEM_PROMPT,
     UPDATE_STUDENT_STATUS_USER_PROMPT
 )
-from src.utils.constants import CHAT_DEPLOYMENT_NAME, AZURE_OPENAI_ENDPOINT, API_VERSION
-from src.utils.LLM_utils import SystemMessage, HumanMessage, LoggingAzureChatOpenAI
+from src.utils.constants import (
+    STUDENT_STORE_BACKEND, STUDENTS_SQLITE_PATH,
+    MASTERY_EMA_ALPHA, MASTERY_LAST_NOTES, MASTERY_TOP_WEAK_TOPICS,
+    MASTERY_SUMMARY_MAX_ATTEMPTS, MASTERY_SUMMARY_APPLIED_KEYS
+)
+from src.utils.folders_utils import get_local_db_folder
+from src.utils.LLM_utils import SystemMessage, HumanMessage, LoggingAzureChatOpenAI, get_chat_model
 from src.utils.helper_function import json_parser
-from src.data.index_and_search import get_db_object, index_df
+from src.data.index_and_search import get_db_object, INSERT_TOKEN_FIELD
+from qdrant_client.models import (
+    Filter, FieldCondition, FilterSelector, IsEmptyCondition, MatchAny, MatchValue, PayloadField
+)
+from loguru import logger
 
 STUDENTS_COLLECTION = "students_db"
+# enrollments are points of their own in STUDENTS_COLLECTION (id: uuid of "<student_id>|<course>")
+ENROLLMENT_ID_COL = "enrollment_uid"
+ENROLLED_STUDENT_FIELD = "enrolled_student_id"
+
+
+# ----------------------
+# Mastery aggregates
+# ----------------------
+def update_mastery_summary(summary: Optional[Dict[str, Any]], entry: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Fold one status entry into the running aggregates of a (student, course):
+    count, EMA of the score, trend, last notes and weak-topic counters. Constant size in the history length.
+    """
+    summary = dict(summary or {"count": 0, "ema_score": None, "trend": "n/a", "last_notes": [], "weak_topics": {}})
+    summary["count"] += 1
+
+    score = entry.get("score")
+    if isinstance(score, (int, float)):
+        previous_ema = summary["ema_score"]
+        if previous_ema is None:
+            summary["ema_score"] = float(score)
+        else:
+            summary["ema_score"] = round(MASTERY_EMA_ALPHA * score + (1 - MASTERY_EMA_ALPHA) * previous_ema, 2)
+            delta = score - previous_ema
+            summary["trend"] = "improving" if delta > 2 else "declining" if delta < -2 else "stable"
+        summary["last_score"] = score
+
+    if entry.get("note"):
+        note = f"{entry.get('date', '')}: {entry['note']}".strip(": ")
+        summary["last_notes"] = (summary["last_notes"] + [note])[-MASTERY_LAST_NOTES:]
+
+    weak_topics = dict(summary["weak_topics"])
+    for topic in entry.get("weak_topics") or []:
+        topic = str(topic).strip().lower()
+        if topic:
+            weak_topics[topic] = weak_topics.get(topic, 0) + 1
+    summary["weak_topics"] = weak_topics
+    summary["last_date"] = entry.get("date", summary.get("last_date"))
+    return summary
+
+
+def build_mastery_summary(entries: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Aggregates of a whole course history (used for records that have no maintained summary yet)."""
+    summary = None
+    for entry in entries:
+        summary = update_mastery_summary(summary, entry)
+    return summary
+
+
+def format_mastery_summary(summary: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Compact, prompt-ready view of the aggregates."""
+    if not summary:
+        return {"sessions": 0}
+    top_weak_topics = sorted(summary["weak_topics"].items(), key=lambda item: -item[1])[:MASTERY_TOP_WEAK_TOPICS]
+    return {
+        "sessions": summary["count"],
+        "mastery_score": summary["ema_score"],
+        "last_score": summary.get("last_score"),
+        "trend": summary["trend"],
+        "weak_topics": dict(top_weak_topics),
+        "recent_notes": summary["last_notes"],
+    }
+
+
+# ----------------------
+# Student record stores
+# ----------------------
+class QdrantStudentStore:
+    """
+    Students stored as points of the students_db Qdrant collection (dummy vector of dim 1).
+    Payload format: {"student_id": ..., "name": ..., "status": [{course: [entries]}, ...],
+                     "history": {course: {entry_key: entry}}, "summary": {course: aggregates}}
+    "status" holds the full course histories; entries appended later go to "history", keyed by a
+    time-ordered unique key, so an append is a single server-side merge of the new entry only.
+    Course enrollments are separate points {"enrollment_uid": "<student_id>|<course>", "enrolled_student_id": ...,
+    "course": ...}: enrolling never rewrites the student's payload (records created earlier may still hold
+    a "courses": {course: True} field).
+    """
+
+    def _get_summaries(self, student_id: str) -> Optional[Dict[str, Any]]:
+        """Only the "summary" part of the student's payload (or None if the student does not exist)."""
+        student_data = get_db_object().get_items_data(
+            collection_name=STUDENTS_COLLECTION,
+            item_ids=[student_id],
+            id_col="student_id",
+            include_fields=["summary"],
+        )
+        if not student_data or student_id not in student_data:
+            return None
+        return student_data[student_id].get("summary") or {}
+
+    def get_course_summary(self, student_id: str, course: str) -> Optional[Dict[str, Any]]:
+        """Return the course's mastery aggregates ({} if none yet), or None if the student does not exist."""
+        summaries = self._get_summaries(student_id)
+        if summaries is None:
+            return None
+        if course in summaries:
+            return summaries[course]
+        # records created before summaries were maintained
+        return build_mastery_summary(self.get_course_history(student_id, course) or []) or {}
+
+    def get_student(self, student_id: str) -> Optional[Dict[str, Any]]:
+        student_data = get_db_object().get_items_data(
+            collection_name=STUDENTS_COLLECTION,
+            item_ids=[student_id],
+            id_col="student_id",
+        )
+        if not student_data or student_id not in student_data:
+            return None
+        return self._to_student(student_data[student_id], self._get_enrollments([student_id]).get(student_id, []))
+
+    def _to_student(self, payload: Dict[str, Any], enrolled_courses: List[str] = ()) -> Dict[str, Any]:
+        payload = self._merge_history(payload, enrolled_courses)
+        payload.pop("summary", None)
+        payload.pop(INSERT_TOKEN_FIELD, None)
+        return payload
+
+    @staticmethod
+    def _enrollment_point(student_id: str, course: str) -> tuple:
+        return [0.0], {ENROLLMENT_ID_COL: f"{student_id}|{course}", ENROLLED_STUDENT_FIELD: student_id, "course": course}
+
+    def _get_enrollments(self, student_ids: List[str]) -> Dict[str, List[str]]:
+        """{student_id: [enrolled courses]} of the given students (one request per 1000 enrollments)."""
+        enrollments, offset = {}, None
+        while True:
+            points, offset = get_db_object().qdrant_client.scroll(
+                collection_name=STUDENTS_COLLECTION,
+                scroll_filter=Filter(must=[FieldCondition(key=ENROLLED_STUDENT_FIELD, match=MatchAny(any=student_ids))]),
+                limit=1000, offset=offset, with_payload=True,
+            )
+            for point in points:
+                enrollments.setdefault(point.payload[ENROLLED_STUDENT_FIELD], []).append(point.payload["course"])
+            if offset is None:
+                return enrollments
+
+    def iter_students(self, batch_size: int = 256) -> Iterator[List[Dict[str, Any]]]:
+        """Yield all students, batch_size at a time, in the upsert_students format."""
+        qdrant_client = get_db_object().qdrant_client
+        if not qdrant_client.collection_exists(STUDENTS_COLLECTION):
+            return
+        offset = None
+        while True:
+            points, offset = qdrant_client.scroll(
+                collection_name=STUDENTS_COLLECTION, limit=batch_size, offset=offset, with_payload=True,
+                # students only, not their enrollment points
+                scroll_filter=Filter(must=[IsEmptyCondition(is_empty=PayloadField(key=ENROLLED_STUDENT_FIELD))]),
+            )
+            enrollments = self._get_enrollments([point.payload["student_id"] for point in points]) if points else {}
+            yield [self._to_student(point.payload, enrollments.get(point.payload["student_id"], [])) for point in points]
+            if offset is None:
+                break
+
+    @staticmethod
+    def _merge_history(payload: Dict[str, Any], enrolled_courses: List[str] = ()) -> Dict[str, Any]:
+        """Fold the appended "history" entries and the enrolled courses into "status", in append order."""
+        history = payload.pop("history", None) or {}
+        status = payload.setdefault("status", [])
+        for course in [*(payload.pop("courses", None) or {}), *enrolled_courses]:
+            history.setdefault(course, {})
+        for course, entries in history.items():
+            ordered_entries = [entries[entry_key] for entry_key in sorted(entries)]
+            for course_dict in status:
+                if course in course_dict:
+                    course_dict[course].extend(ordered_entries)
+                    break
+            else:
+                status.append({course: ordered_entries})
+        return payload
+
+    @staticmethod
+    def _course_entries(payload: Dict[str, Any], course: str) -> List[Dict[str, Any]]:
+        """The course's entries of a payload: the imported "status" ones, then the appended ones in append order."""
+        entries = []
+        for course_dict in payload.get("status", []):
+            if course in course_dict:
+                entries.extend(course_dict[course])
+        appended = (payload.get("history") or {}).get(course) or {}
+        return entries + [appended[entry_key] for entry_key in sorted(appended)]
+
+    def _get_course_payloads(self, student_ids: List[str], courses: List[str]) -> Dict[str, Any]:
+        """{student_id: payload} projected on the parts holding the given courses' entries (one request)."""
+        return get_db_object().get_items_data(
+            collection_name=STUDENTS_COLLECTION,
+            item_ids=student_ids,
+            id_col="student_id",
+            include_fields=["status"] + [f"history.{course}" for course in dict.fromkeys(courses)],
+        ) or {}
+
+    def get_course_history(self, student_id: str, course: str) -> Optional[List[Dict[str, Any]]]:
+        """Return the course's status entries, or None if the student does not exist."""
+        payload = self._get_course_payloads([student_id], [course]).get(student_id)
+        if payload is None:
+            return None
+        return self._course_entries(payload, course)
+
+    def upsert_students(self, records: List[Dict[str, Any]]) -> None:
+        """Insert or fully replace students ({"student_id", "name", "status"}), in a single upsert per batch."""
+        db = get_db_object()
+        db.create_collection(STUDENTS_COLLECTION, dim=1)
+        # fully replaced: the students' previous enrollments go too (the status lists the courses)
+        db.qdrant_client.delete(
+            collection_name=STUDENTS_COLLECTION,
+            points_selector=FilterSelector(filter=Filter(must=[FieldCondition(
+                key=ENROLLED_STUDENT_FIELD, match=MatchAny(any=[str(record["student_id"]) for record in records]))])),
+        )
+        data = [
+            ([0.0], {**record, "student_id": str(record["student_id"]),
+                     "summary": {course: build_mastery_summary(entries)
+                                 for course_dict in record.get("status", [])
+                                 for course, entries in course_dict.items() if entries}})
+            for record in records
+        ]
+        db.insert_data(STUDENTS_COLLECTION, data, id_col="student_id")
+
+    def ensure_student(self, student_id: str, name: str, course: str) -> bool:
+        """
+        Create the student if absent and enroll them in the course, without reading the record first
+        (a single request for an existing student). The enrollment is its own point, upserted in the same
+        request: concurrent first logins to different courses never overwrite each other's enrollment.
+        Returns True if this call created the student.
+        """
+        return get_db_object().update_or_insert(
+            collection_name=STUDENTS_COLLECTION,
+            item_id=student_id,
+            default_payload={"student_id": student_id, "name": name, "status": []},
+            id_col="student_id",
+            extra_data=[self._enrollment_point(student_id, course)],
+            extra_id_col=ENROLLMENT_ID_COL,
+        )
+
+    def append_status_entry(self, student_id: str, course: str, entry: Dict[str, Any]) -> bool:
+        """
+        Atomically append an entry to the student's course history and refresh the course summary.
+        Returns False if the student does not exist.
+        """
+        return self.append_status_entries([(student_id, course, entry)]) == 1
+
+    @staticmethod
+    def _new_entry_key() -> str:
+        return f"{time.time_ns():020d}_{uuid.uuid4().hex[:8]}"  # sortable by append time
+
+    def append_status_entries(self, items: List[Tuple[str, str, Dict[str, Any]]]) -> int:
+        """
+        Append many (student_id, course, entry) status entries and fold them into the course summaries.
+        Only the new entries are sent; each is merged on the server under a unique key, so concurrent
+        sessions of the same student never overwrite each other's entries.
+
+        Summaries are updated in O(1) by compare-and-set on their "count": the stored summary is folded with
+        the new entries and written only if its count did not change meanwhile, then read back to check the
+        write was applied (a racing session won otherwise, and the entries are folded into its summary instead).
+        Without contention: 3 requests (summaries read, appends and summary writes in one batch, check).
+        Entries of unknown students are skipped. Returns the number of appended entries.
+        """
+        new_entries = {}  # (student_id, course) -> {entry_key: entry}
+        for student_id, course, entry in items:
+            new_entries.setdefault((str(student_id), course), {})[self._new_entry_key()] = entry
+        summaries = self._get_course_summaries(new_entries)
+        new_entries = {pair: entries for pair, entries in new_entries.items() if pair[0] in summaries}
+        if not new_entries:
+            return 0
+
+        bases = self._legacy_summaries([pair for pair in new_entries if pair[1] not in summaries[pair[0]]])
+        appends = [(student_id, entries, f"history.{course}") for (student_id, course), entries in new_entries.items()]
+        pending = new_entries
+        for _ in range(MASTERY_SUMMARY_MAX_ATTEMPTS):
+            writes = [
+                self._summary_write(student_id, course, summaries[student_id].get(course),
+                                    bases.get((student_id, course)), entries)
+                for (student_id, course), entries in pending.items()
+            ]
+            get_db_object().update_metadata_many(STUDENTS_COLLECTION, appends + writes)
+            appends, bases = [], {}
+            summaries = self._get_course_summaries(pending)
+            pending = {
+                (student_id, course): entries for (student_id, course), entries in pending.items()
+                if max(entries) not in (summaries[student_id].get(course) or {}).get("applied_keys", [])
+            }
+            if not pending:
+                break
+        else:
+            logger.warning(f"Course summaries of {sorted(pending)} not updated: too many concurrent updates.")
+        return sum(len(entries) for entries in new_entries.values())
+
+    def _get_course_summaries(self, pairs) -> Dict[str, Dict[str, Any]]:
+        """{student_id: {course: summary}} of existing students, projected on the courses of the (student_id, course) pairs."""
+        payloads = get_db_object().get_items_data(
+            collection_name=STUDENTS_COLLECTION,
+            item_ids=list(dict.fromkeys(student_id for student_id, _ in pairs)),
+            id_col="student_id",
+            include_fields=[f"summary.{course}" for course in dict.fromkeys(course for _, course in pairs)],
+        ) or {}
+        return {student_id: payload.get("summary") or {} for student_id, payload in payloads.items()}
+
+    def _legacy_summaries(self, pairs: List[Tuple[str, str]]) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        """Summaries built from the full history, for records created before summaries were maintained."""
+        if not pairs:
+            return {}
+        payloads = self._get_course_payloads(list(dict.fromkeys(s for s, _ in pairs)), [c for _, c in pairs])
+        return {(student_id, course): build_mastery_summary(self._course_entries(payloads.get(student_id, {}), course))
+                for student_id, course in pairs}
+
+    @staticmethod
+    def _summary_write(student_id: str, course: str, stored: Optional[Dict[str, Any]], base: Optional[Dict[str, Any]],
+                       entries: Dict[str, Dict[str, Any]]) -> tuple:
+        """Conditional update writing the stored summary (or base, if none is stored) folded with the entries."""
+        summary = stored or base
+        for entry_key in sorted(entries):
+            summary = update_mastery_summary(summary, entries[entry_key])
+        # one key per write (its last entry's), telling the writer whether the write was applied
+        summary["applied_keys"] = ((stored or {}).get("applied_keys", []) + [max(entries)])[-MASTERY_SUMMARY_APPLIED_KEYS:]
+        count_field = f"summary.{course}.count"
+        if stored:
+            only_if = FieldCondition(key=count_field, match=MatchValue(value=stored["count"]))
+        else:
+            only_if = IsEmptyCondition(is_empty=PayloadField(key=count_field))
+        return student_id, {course: summary}, "summary", only_if
+
+
+class SQLiteStudentStore:
+    """
+    Students stored in a local SQLite database (WAL mode), looked up by primary key.
+    Course enrollments and status entries live in their own tables, indexed by (student_id, course),
+    so reads and appends do not depend on the size of the student's whole record.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS students (
+                student_id TEXT PRIMARY KEY,
+                name TEXT
+            );
+            CREATE TABLE IF NOT EXISTS student_courses (
+                student_id TEXT NOT NULL,
+                course TEXT NOT NULL,
+                PRIMARY KEY (student_id, course)
+            );
+            CREATE TABLE IF NOT EXISTS course_history (
+                entry_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                student_id TEXT NOT NULL,
+                course TEXT NOT NULL,
+                entry TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_course_history ON course_history (student_id, course, entry_id);
+            CREATE TABLE IF NOT EXISTS course_summary (
+                student_id TEXT NOT NULL,
+                course TEXT NOT NULL,
+                summary TEXT NOT NULL,
+                PRIMARY KEY (student_id, course)
+            );
+        """)
+        self._conn.commit()
+
+    def _student_exists(self, student_id: str) -> bool:
+        row = self._conn.execute("SELECT 1 FROM students WHERE student_id = ?", (student_id,)).fetchone()
+        return row is not None
+
+    def get_student(self, student_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT name FROM students WHERE student_id = ?", (student_id,)).fetchone()
+            if row is None:
+                return None
+            return self._read_student(student_id, row[0])
+
+    def _read_student(self, student_id: str, name: str) -> Dict[str, Any]:
+        courses = [c for (c,) in self._conn.execute(
+            "SELECT course FROM student_courses WHERE student_id = ? ORDER BY rowid", (student_id,))]
+        history = self._conn.execute(
+            "SELECT course, entry FROM course_history WHERE student_id = ? ORDER BY entry_id", (student_id,)
+        ).fetchall()
+        status = {course: [] for course in courses}
+        for course, entry in history:
+            status.setdefault(course, []).append(json.loads(entry))
+        return {
+            "student_id": student_id,
+            "name": name,
+            "status": [{course: entries} for course, entries in status.items()],
+        }
+
+    def iter_students(self, batch_size: int = 256) -> Iterator[List[Dict[str, Any]]]:
+        """Yield all students, batch_size at a time, in the upsert_students format."""
+        last_id = ""
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT student_id, name FROM students WHERE student_id > ? ORDER BY student_id LIMIT ?",
+                    (last_id, batch_size),
+                ).fetchall()
+                batch = [self._read_student(student_id, name) for student_id, name in rows]
+            if not rows:
+                break
+            yield batch
+            last_id = rows[-1][0]
+
+    def get_course_history(self, student_id: str, course: str) -> Optional[List[Dict[str, Any]]]:
+        """Return the course's status entries, or None if the student does not exist."""
+        with self._lock:
+            if not self._student_exists(student_id):
+                return None
+            rows = self._conn.execute(
+                "SELECT entry FROM course_history WHERE student_id = ? AND course = ? ORDER BY entry_id",
+                (student_id, course),
+            ).fetchall()
+        return [json.loads(entry) for (entry,) in rows]
+
+    def upsert_students(self, records: List[Dict[str, Any]]) -> None:
+        """Insert or fully replace students given in the payload format of QdrantStudentStore."""
+        with self._lock, self._conn:
+            for record in records:
+                student_id = str(record["student_id"])
+                self._conn.execute(
+                    "INSERT INTO students (student_id, name) VALUES (?, ?) "
+                    "ON CONFLICT(student_id) DO UPDATE SET name = excluded.name",
+                    (student_id, record.get("name")),
+                )
+                self._conn.execute("DELETE FROM student_courses WHERE student_id = ?", (student_id,))
+                self._conn.execute("DELETE FROM course_history WHERE student_id = ?", (student_id,))
+                self._conn.execute("DELETE FROM course_summary WHERE student_id = ?", (student_id,))
+                for course_dict in record.get("status", []):
+                    for course, entries in course_dict.items():
+                        self._conn.execute(
+                            "INSERT OR IGNORE INTO student_courses (student_id, course) VALUES (?, ?)",
+                            (student_id, course),
+                        )
+                        self._conn.executemany(
+                            "INSERT INTO course_history (student_id, course, entry) VALUES (?, ?, ?)",
+                            [(student_id, course, json.dumps(entry, ensure_ascii=False)) for entry in entries],
+                        )
+                        if entries:
+                            self._conn.execute(
+                                "INSERT OR REPLACE INTO course_summary (student_id, course, summary) VALUES (?, ?, ?)",
+                                (student_id, course, json.dumps(build_mastery_summary(entries), ensure_ascii=False)),
+                            )
+
+    def get_course_summary(self, student_id: str, course: str) -> Optional[Dict[str, Any]]:
+        """Return the course's mastery aggregates ({} if none yet), or None if the student does not exist."""
+        with self._lock:
+            if not self._student_exists(student_id):
+                return None
+            row = self._conn.execute(
+                "SELECT summary FROM course_summary WHERE student_id = ? AND course = ?", (student_id, course)
+            ).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def ensure_student(self, student_id: str, name: str, course: str) -> bool:
+        """Create the student if absent and enroll them in the course, in one transaction. Returns True if created."""
+        with self._lock, self._conn:
+            created = self._conn.execute(
+                "INSERT INTO students (student_id, name) VALUES (?, ?) ON CONFLICT(student_id) DO NOTHING",
+                (student_id, name),
+            ).rowcount == 1
+            self._conn.execute(
+                "INSERT OR IGNORE INTO student_courses (student_id, course) VALUES (?, ?)", (student_id, course)
+            )
+        return created
+
+    def append_status_entry(self, student_id: str, course: str, entry: Dict[str, Any]) -> bool:
+        """Append an entry to the student's course history. Returns False if the student does not exist."""
+        return self.append_status_entries([(student_id, course, entry)]) == 1
+
+    def append_status_entries(self, items: List[Tuple[str, str, Dict[str, Any]]]) -> int:
+        """
+        Append many (student_id, course, entry) status entries in one transaction, together with their summaries.
+        Entries of unknown students are skipped. Returns the number of appended entries.
+        """
+        n_appended = 0
+        with self._lock, self._conn:
+            for student_id, course, entry in items:
+                student_id = str(student_id)
+                if not self._student_exists(student_id):
+                    continue
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO student_courses (student_id, course) VALUES (?, ?)", (student_id, course)
+                )
+                self._conn.execute(
+                    "INSERT INTO course_history (student_id, course, entry) VALUES (?, ?, ?)",
+                    (student_id, course, json.dumps(entry, ensure_ascii=False)),
+                )
+                # the summary is updated in the same transaction as the entry
+                row = self._conn.execute(
+                    "SELECT summary FROM course_summary WHERE student_id = ? AND course = ?", (student_id, course)
+                ).fetchone()
+                summary = update_mastery_summary(json.loads(row[0]) if row else None, entry)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO course_summary (student_id, course, summary) VALUES (?, ?, ?)",
+                    (student_id, course, json.dumps(summary, ensure_ascii=False)),
+                )
+                n_appended += 1
+        return n_appended
+
+
+# --- lazy singleton instance + accessor ---
+_STUDENT_STORE_SINGLETON = None
+_STUDENT_STORE_SINGLETON_LOCK = threading.Lock()
+
+def _create_student_store():
+    if STUDENT_STORE_BACKEND == "qdrant":
+        return QdrantStudentStore()
+    if STUDENT_STORE_BACKEND == "sqlite":
+        path = STUDENTS_SQLITE_PATH or get_local_db_folder() / "students.sqlite"
+        return SQLiteStudentStore(path)
+    raise ValueError(f"Unknown STUDENT_STORE_BACKEND '{STUDENT_STORE_BACKEND}', expected one of ['qdrant', 'sqlite']")
+
+def get_student_store():
+    """Return the shared student store, creating it on first use."""
+    global _STUDENT_STORE_SINGLETON
+    if _STUDENT_STORE_SINGLETON is None:
+        with _STUDENT_STORE_SINGLETON_LOCK:
+            if _STUDENT_STORE_SINGLETON is None:
+                _STUDENT_STORE_SINGLETON = _create_student_store()
+    return _STUDENT_STORE_SINGLETON
+
+
+def migrate_students_from_qdrant(batch_size: int = 256) -> int:
+    """Copy all students from the students_db Qdrant collection into the configured student store."""
+    store = get_student_store()
+    n_students = 0
+    for batch in QdrantStudentStore().iter_students(batch_size):
+        store.upsert_students(batch)
+        n_students += len(batch)
+    print(f"Migrated {n_students} students from '{STUDENTS_COLLECTION}'.")
+    return n_students
 
 
-@lru_cache(maxsize=1)
 def get_model() -> LoggingAzureChatOpenAI:
     """Return a cached LLM instance for Student Evaluator."""
-    return LoggingAzureChatOpenAI(
-        agent_name="STUDENT_EVALUATOR",
-        azure_deployment=CHAT_DEPLOYMENT_NAME,
-        azure_endpoint=AZURE_OPENAI_ENDPOINT,
-        openai_api_version=API_VERSION,
-        openai_api_type="azure",
-        temperature=0,
-    )
+    return get_chat_model("STUDENT_EVALUATOR")
 
 
 # ----------------------
@@ -35,22 +564,25 @@ def get_student_course_status(student_id: str=None, course: str=None, **kwargs)
     """
     Retrieve the student's historical status entries for a given course.
     """
-    student_data = get_db_object().get_items_data(
-        collection_name="students_db",
-        item_ids=[student_id],
-        id_col="student_id",
-    )
-    if not student_data or student_id not in student_data:
+    statuses = get_student_store().get_course_history(student_id, course)
+    if statuses is None:
         return {"error": f"Student {student_id} not found."}
 
-    statuses = []
-    for course_dict in student_data[student_id].get("status", []):
-        if course in course_dict:
-            statuses.extend(course_dict[course])
-
     return {"student_id": student_id, "course": course, "history": statuses}
 
 
+def get_student_course_summary(student_id: str=None, course: str=None, **kwargs) -> Dict[str, Any]:
+    """
+    Retrieve a compact, constant-size summary of the student's progress in a course
+    (mastery score, trend, weak topics and the latest notes) instead of the full history.
+    """
+    summary = get_student_store().get_course_summary(student_id, course)
+    if summary is None:
+        return {"error": f"Student {student_id} not found."}
+
+    return {"student_id": student_id, "course": course, "summary": format_mastery_summary(summary)}
+
+
 # ----------------------
 # Tool 2: Update status
 # ----------------------
@@ -58,13 +590,8 @@ def update_student_course_status(student_id: str, course: str, current_session_f
     """
     Use the LLM to convert session feedback into a structured status entry and update the DB.
     """
-    # Fetch current record
-    student_data = get_db_object().get_items_data(
-        collection_name="students_db",
-        item_ids=[student_id],
-        id_col="student_id",
-    )
-    if not student_data or student_id not in student_data:
+    store = get_student_store()
+    if store.get_course_summary(student_id, course) is None:
         return {"error": f"Student {student_id} not found."}
 
     llm = get_model()
@@ -79,23 +606,8 @@ def update_student_course_status(student_id: str, course: str, current_session_f
     parsed = json_parser(getattr(resp, "content", str(resp)))
     parsed.update({"date": datetime.now().strftime("%d-%m-%Y")})
 
-    # Append to the correct course
-    found_course = False
-    for course_dict in student_data[student_id].get("status", []):
-        if course in course_dict:
-            course_dict[course].append(parsed)
-            found_course = True
-            break
-
-    if not found_course:
-        student_data[student_id].setdefault("status", []).append({course: [parsed]})
-
-    # Save
-    get_db_object().update_metadata(
-        collection_name="students_db",
-        item_id=student_id,
-        new_metadata=student_data[student_id]
-    )
+    if not store.append_status_entry(student_id, course, parsed):
+        return {"error": f"Student {student_id} not found."}
 
     return {"message": "Student status updated successfully.", "new_entry": parsed}
 
@@ -156,82 +668,24 @@ def init_students_db_with_few_examples():
         }
     ]
 
-    # Convert to DataFrame
-    df_students = pd.DataFrame(students_data)
-
-    # Index into Qdrant (no embeddings needed, so need_to_embed_col=False)
-    index_df(
-        df=df_students,
-        index_by_col="student_id",     # used to generate IDs
-        need_to_embed_col=False,       # no semantic search needed here
-        id_col="student_id",           # unique identifier
-        collection_name=STUDENTS_COLLECTION
-    )
+    get_student_store().upsert_students(students_data)
 
-    print(f"Inserted {len(df_students)} example students into '{STUDENTS_COLLECTION}' collection.")
+    print(f"Inserted {len(students_data)} example students into the student store.")
 
 
 def _ensure_student_exists(name: str, course: str, student_id: str) -> None:
     """
-    Ensure a test student with a minimal schema exists in the students_db collection.
+    Ensure a test student with a minimal schema exists in the student store.
     If not found, create it with a single empty course history.
     """
-    db = get_db_object()
-    existing = db.get_items_data(
-        collection_name=STUDENTS_COLLECTION,
-        item_ids=[student_id],
-        id_col="student_id",
-    )
-
-    if existing and student_id in existing:
-        # Ensure the course key exists
-        payload = existing[student_id]
-        has_course = False
-        for course_dict in payload.get("status", []):
-            if course in course_dict:
-                has_course = True
-                break
-        if not has_course:
-            payload.setdefault("status", []).append({course: []})
-            db.update_metadata(
-                collection_name=STUDENTS_COLLECTION,
-                item_id=student_id,
-                new_metadata=payload,
-            )
-        return student_id
-
-    # Create new record using index_df (no embeddings needed)
-    df = pd.DataFrame([{
-        "student_id": student_id,
-        "name": name,
-        "status": [{course: []}],   # list of dicts; each course maps to a list of entries
-    }])
-
-    index_df(
-        df=df,
-        index_by_col="student_id",     # arbitrary when need_to_embed_col=False
-        need_to_embed_col=False,       # store with dummy vectors (dim=1)
-        id_col="student_id",
-        collection_name=STUDENTS_COLLECTION,
-    )
+    get_student_store().ensure_student(student_id, name, course)
     return student_id
 
 
 def _course_history_len(student_id: str, course: str) -> int:
     """Return how many status entries exist for (student, course)."""
-    db = get_db_object()
-    data = db.get_items_data(
-        collection_name=STUDENTS_COLLECTION,
-        item_ids=[student_id],
-        id_col="student_id",
-    )
-    if not data or student_id not in data:
-        return 0
-    payload = data[student_id]
-    for course_dict in payload.get("status", []):
-        if course in course_dict:
-            return len(course_dict[course])
-    return 0
+    history = get_student_store().get_course_history(student_id, course)
+    return len(history) if history else 0
 
 
 def _test_common_get_student_course_status():
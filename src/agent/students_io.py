@@ -0,0 +1,178 @@
+"""
+Bulk import / export of students and batched status updates.
+
+Files are JSONL (one JSON object per line) or Parquet (chosen by the file suffix):
+- students: {"student_id": ..., "name": ..., "status": [{course: [entries]}, ...]}
+- status updates: {"student_id": ..., "course": ..., "entry": {"score": ..., "note": ..., "date": ...}}
+In Parquet files the nested "status" / "entry" columns are stored as JSON strings.
+
+Usage:
+    python -m src.agent.students_io import roster.jsonl
+    python -m src.agent.students_io export students.parquet
+    python -m src.agent.students_io update nightly_scores.jsonl
+"""
+import argparse
+import json
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List
+
+from loguru import logger
+
+from src.agent.student_evaluator import get_student_store
+from src.utils.constants import STUDENTS_BULK_CHUNK_SIZE, STUDENTS_BULK_MAX_WORKERS
+
+NESTED_COLUMNS = ("status", "entry")
+
+
+# ----------------------
+# Files
+# ----------------------
+def _is_parquet(path: Path) -> bool:
+    return Path(path).suffix.lower() in (".parquet", ".pq")
+
+
+def read_records(path: Path, chunk_size: int = STUDENTS_BULK_CHUNK_SIZE) -> Iterator[List[Dict[str, Any]]]:
+    """Yield the records of a JSONL / Parquet file, chunk_size at a time."""
+    if _is_parquet(path):
+        import pyarrow.parquet as pq  # only needed for Parquet files
+        # streamed: only one batch of rows is decoded at a time
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            records = batch.to_pylist()
+            for record in records:
+                for column in NESTED_COLUMNS:
+                    if isinstance(record.get(column), str):
+                        record[column] = json.loads(record[column])
+            yield records
+        return
+
+    chunk = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                chunk.append(json.loads(line))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def write_records(path: Path, chunks: Iterable[List[Dict[str, Any]]]) -> int:
+    """Write chunks of records to a JSONL / Parquet file. Returns the number of written records."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if _is_parquet(path):
+        import pyarrow as pa  # only needed for Parquet files
+        import pyarrow.parquet as pq
+        # streamed: each chunk is written as its own row group (the schema is the first chunk's)
+        writer, n_records = None, 0
+        try:
+            for chunk in chunks:
+                if not chunk:
+                    continue
+                records = [
+                    {key: json.dumps(value, ensure_ascii=False) if key in NESTED_COLUMNS else value
+                     for key, value in record.items()}
+                    for record in chunk
+                ]
+                table = pa.Table.from_pylist(records, schema=writer.schema if writer else None)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema)
+                writer.write_table(table)
+                n_records += len(records)
+        finally:
+            if writer is not None:
+                writer.close()
+        if writer is None:
+            pq.write_table(pa.table({}), path)
+        return n_records
+
+    n_records = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for chunk in chunks:
+            f.writelines(json.dumps(record, ensure_ascii=False) + "\n" for record in chunk)
+            n_records += len(chunk)
+    return n_records
+
+
+# ----------------------
+# Bulk operations
+# ----------------------
+def _run_in_parallel(fn: Callable[[List[Dict[str, Any]]], int], chunks: Iterable[List[Dict[str, Any]]],
+                     max_workers: int) -> int:
+    """Apply fn to every chunk with up to max_workers chunks in flight. Returns the sum of fn's results."""
+    total = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        pending = set()
+        for chunk in chunks:
+            # bound the number of chunks held in memory
+            if len(pending) >= 2 * max_workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                total += sum(future.result() for future in done)
+            pending.add(pool.submit(fn, chunk))
+        total += sum(future.result() for future in wait(pending).done)
+    return total
+
+
+def import_students(path: Path, chunk_size: int = STUDENTS_BULK_CHUNK_SIZE,
+                    max_workers: int = STUDENTS_BULK_MAX_WORKERS) -> int:
+    """Insert or fully replace the students of a file in the student store. Returns the number of students."""
+    store = get_student_store()
+
+    def upsert_chunk(records: List[Dict[str, Any]]) -> int:
+        store.upsert_students(records)
+        logger.info(f"Imported {len(records)} students.")
+        return len(records)
+
+    n_students = _run_in_parallel(upsert_chunk, read_records(path, chunk_size), max_workers)
+    print(f"Imported {n_students} students from '{path}'.")
+    return n_students
+
+
+def export_students(path: Path, chunk_size: int = STUDENTS_BULK_CHUNK_SIZE) -> int:
+    """Write all students of the student store to a file. Returns the number of students."""
+    n_students = write_records(path, get_student_store().iter_students(chunk_size))
+    print(f"Exported {n_students} students to '{path}'.")
+    return n_students
+
+
+def apply_status_updates(path: Path, chunk_size: int = STUDENTS_BULK_CHUNK_SIZE) -> int:
+    """
+    Append the status entries of a file (e.g. nightly score corrections) to the students' course histories,
+    chunk_size entries per batched write. Entries of unknown students are skipped.
+    Chunks are applied one after the other, so the summaries of a (student, course) never race.
+    Returns the number of appended entries.
+    """
+    store = get_student_store()
+    n_records, n_appended = 0, 0
+    for records in read_records(path, chunk_size):
+        n_records += len(records)
+        n_appended += store.append_status_entries(
+            [(record["student_id"], record["course"], record["entry"]) for record in records]
+        )
+    if n_appended < n_records:
+        logger.warning(f"Skipped {n_records - n_appended} status entries of unknown students.")
+    print(f"Appended {n_appended} status entries from '{path}'.")
+    return n_appended
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import / export of students and their course histories.")
+    parser.add_argument("command", choices=["import", "export", "update"],
+                        help="import students, export students, or append status entries")
+    parser.add_argument("path", type=Path, help="JSONL or Parquet file")
+    parser.add_argument("--chunk-size", type=int, default=STUDENTS_BULK_CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, default=STUDENTS_BULK_MAX_WORKERS, help="parallel imports")
+    args = parser.parse_args()
+
+    if args.command == "import":
+        import_students(args.path, args.chunk_size, args.workers)
+    elif args.command == "export":
+        export_students(args.path, args.chunk_size)
+    else:
+        apply_status_updates(args.path, args.chunk_size)
+
+
+if __name__ == "__main__":
+    main()
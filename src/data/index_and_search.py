@@ -1,11 +1,25 @@
-from propcache import cached_property
-from qdrant_client.models import Distance, VectorParams, PointStruct, Filter, FieldCondition, MatchValue
+from qdrant_client.models import (
+    Distance, VectorParams, PointStruct, Filter, FieldCondition, MatchValue, MatchAny, SearchRequest, PayloadSchemaType,
+    PayloadSelectorInclude, PayloadSelectorExclude, HnswConfigDiff, ScalarQuantization, ScalarQuantizationConfig,
+    ScalarType, SearchParams, QuantizationSearchParams, VectorParamsDiff, CollectionParamsDiff, SetPayload,
+    SetPayloadOperation, HasIdCondition, UpsertOperation, PointsList
+)
 from qdrant_client import QdrantClient
-from src.utils.constants import QDRANT_CLUSTER_URL, QDRANT_API_KEY, EMBEDDING_DIM
+from qdrant_client.http.exceptions import UnexpectedResponse
+from src.utils.constants import (
+    QDRANT_CLUSTER_URL, QDRANT_API_KEY, EMBEDDING_DIM, DB_BACKEND, QDRANT_LOCAL_PATH,
+    INDEX_CHUNK_SIZE, UPSERT_BATCH_SIZE, DEBUG_MODE, SEARCH_CACHE_MAX_ENTRIES, SEARCH_CACHE_TTL_SECONDS
+)
+from src.utils.folders_utils import get_cache_folder
+from src.utils.ttl_cache import TTLCache
 from src.utils.LLM_utils import get_embedding_object
 from typing import List
 from loguru import logger
 from tqdm import tqdm
+import copy
+import hashlib
+import json
+import threading
 import uuid
 import pandas as pd
 
@@ -16,22 +30,197 @@ COURSE_TO_COLLECTION_NAME = {
     'SAT': "sat_questions"
 }
 
+# Payload field of the token written by DB.update_or_insert to tell which concurrent insert was kept
+INSERT_TOKEN_FIELD = "_insert_token"
+
+# Single collection holding the questions of all courses, narrowed by payload filters
+UNIFIED_QUESTIONS_COLLECTION = "questions"
+UNIFIED_QUESTIONS_ID_COL = "question_uid"
+QUESTION_PAYLOAD_INDEXES = {
+    "course": PayloadSchemaType.KEYWORD,
+    "topic": PayloadSchemaType.KEYWORD,
+    "module": PayloadSchemaType.KEYWORD,
+    "difficulty": PayloadSchemaType.KEYWORD,
+    "source": PayloadSchemaType.KEYWORD,
+}
+# Payload field holding the topic of the questions in each per-course collection
+COURSE_TO_TOPIC_FIELD = {
+    'Math': "module",
+    'Science': "topic",
+    'History': "US_state",
+    'SAT': "topic"
+}
+
+# Unified-collection fields each course's questions can be filtered on: the others hold no real value for the
+# course (only Science questions have a difficulty, History's "topic" is the US state)
+COURSE_TO_FILTER_FIELDS = {
+    'Math': ("topic", "module"),
+    'Science': ("topic", "difficulty"),
+    'History': (),
+    'SAT': ("topic",),
+}
+
+# Per-collection storage / index options (see DB.create_collection). Collections not listed use Qdrant defaults.
+# Keys: hnsw_m, hnsw_ef_construct, hnsw_ef (search time), on_disk_vectors, on_disk_payload, quantization (int8)
+COLLECTION_CONFIGS = {
+    # tens of thousands of 1536-d vectors: keep int8 vectors in RAM, originals on disk, rescore on search
+    "math_questions": {
+        "hnsw_m": 16,
+        "hnsw_ef_construct": 100,
+        "hnsw_ef": 128,
+        "on_disk_vectors": True,
+        "on_disk_payload": True,
+        "quantization": True,
+    },
+}
+
 def convert_to_uuid(id):
     return str(uuid.uuid5(uuid.NAMESPACE_DNS, str(id)))
 
+def build_filter(filters: dict = None):
+    """
+    Convert a {field: value} dict to a Qdrant filter (all conditions must match).
+    A list/tuple/set value matches any of its values, e.g. {"course": "Math", "difficulty": ["medium", "hard"]}.
+    """
+    if not filters:
+        return None
+    conditions = []
+    for field, value in filters.items():
+        if isinstance(value, (list, tuple, set)):
+            conditions.append(FieldCondition(key=field, match=MatchAny(any=list(value))))
+        else:
+            conditions.append(FieldCondition(key=field, match=MatchValue(value=value)))
+    return Filter(must=conditions)
+
+def is_not_found_error(error: Exception) -> bool:
+    """True for the error of a request on a missing collection or point (404, or the local client's errors)."""
+    if isinstance(error, UnexpectedResponse):
+        return error.status_code == 404
+    return isinstance(error, KeyError) or (isinstance(error, ValueError) and "not found" in str(error))
+
+def build_payload_selector(include_fields: List[str] = None, exclude_fields: List[str] = None):
+    """
+    Payload projection for searches: return only include_fields, or everything except exclude_fields.
+    Smaller payloads mean fewer bytes on the wire and fewer prompt tokens downstream.
+    """
+    if include_fields:
+        return PayloadSelectorInclude(include=list(include_fields))
+    if exclude_fields:
+        return PayloadSelectorExclude(exclude=list(exclude_fields))
+    return True
+
+def _get_collection_config(collection_name: str, config: dict = None) -> dict:
+    """Default config of the collection, overridden by the given config."""
+    return {**COLLECTION_CONFIGS.get(collection_name, {}), **(config or {})}
+
+def _hnsw_config(config: dict):
+    if config.get("hnsw_m") is None and config.get("hnsw_ef_construct") is None:
+        return None
+    return HnswConfigDiff(m=config.get("hnsw_m"), ef_construct=config.get("hnsw_ef_construct"))
+
+def _quantization_config(config: dict):
+    if not config.get("quantization"):
+        return None
+    # int8 scalar quantization; the quantized vectors stay in RAM even when the originals are on disk
+    return ScalarQuantization(scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True))
+
+def _search_params(config: dict, hnsw_ef: int = None):
+    hnsw_ef = hnsw_ef or config.get("hnsw_ef")
+    quantization = QuantizationSearchParams(rescore=True, oversampling=2.0) if config.get("quantization") else None
+    if hnsw_ef is None and quantization is None:
+        return None
+    return SearchParams(hnsw_ef=hnsw_ef, quantization=quantization)
+
+def create_qdrant_client(backend: str = DB_BACKEND) -> QdrantClient:
+    """
+    Create a Qdrant client for the given backend:
+    - "cloud": the remote cluster at QDRANT_CLUSTER_URL.
+    - "memory": in-process store, nothing is persisted (CI / tests).
+    - "local": in-process store persisted to disk (single-node deployments).
+    """
+    if backend == "cloud":
+        return QdrantClient(url=QDRANT_CLUSTER_URL, api_key=QDRANT_API_KEY)
+    if backend == "memory":
+        return QdrantClient(location=":memory:")
+    if backend == "local":
+        path = QDRANT_LOCAL_PATH or get_cache_folder() / "qdrant_local"
+        return QdrantClient(path=str(path))
+    raise ValueError(f"Unknown DB backend '{backend}', expected one of ['cloud', 'memory', 'local']")
+
+
 class DB:
-    def __init__(self):
-        self.qdrant_client = QdrantClient(
-            url=QDRANT_CLUSTER_URL,
-            api_key=QDRANT_API_KEY,
-        )
-        self.embeder_client = get_embedding_object()
+    def __init__(self, backend: str = DB_BACKEND):
+        self.backend = backend
+        self.qdrant_client = create_qdrant_client(backend)
+        # search results cache: (collection, normalized query, top_k, filters) -> payloads
+        self.search_cache = TTLCache(maxsize=SEARCH_CACHE_MAX_ENTRIES, ttl=SEARCH_CACHE_TTL_SECONDS)
 
-    def create_collection(self, collection_name, dim=1):
+    @property
+    def embeder_client(self):
+        return get_embedding_object()
+
+    def create_collection(self, collection_name, dim=1, config: dict = None):
+        """
+        Create the collection if it does not exist.
+        :param config: storage / index options, merged over COLLECTION_CONFIGS[collection_name]:
+            hnsw_m, hnsw_ef_construct (HNSW graph), on_disk_vectors, on_disk_payload (RAM vs. disk),
+            quantization (int8 scalar quantization, rescored on search).
+        """
         if not self.qdrant_client.collection_exists(collection_name):
-            self.qdrant_client.create_collection(
+            self._create_collection(collection_name, dim, config)
+
+    def _create_collection(self, collection_name, dim, config: dict = None):
+        config = _get_collection_config(collection_name, config)
+        self.qdrant_client.create_collection(
+            collection_name=collection_name,
+            vectors_config=VectorParams(size=dim, distance=Distance.COSINE, on_disk=config.get("on_disk_vectors")),
+            hnsw_config=_hnsw_config(config),
+            quantization_config=_quantization_config(config),
+            on_disk_payload=config.get("on_disk_payload"),
+        )
+
+    def tune_collection(self, collection_name, config: dict):
+        """
+        Change the storage / index options (see create_collection) of an existing collection in place.
+        Qdrant rebuilds the index / quantized vectors in the background.
+        """
+        self.qdrant_client.update_collection(
+            collection_name=collection_name,
+            vectors_config={"": VectorParamsDiff(on_disk=config.get("on_disk_vectors"))},
+            hnsw_config=_hnsw_config(config),
+            quantization_config=_quantization_config(config),
+            collection_params=CollectionParamsDiff(on_disk_payload=config.get("on_disk_payload")),
+        )
+        logger.info(f"Collection '{collection_name}' has been updated with {config}.")
+
+    @staticmethod
+    def _search_cache_key(collection_name: str, query: str, top_k: int, filters: dict = None,
+                          include_fields: List[str] = None, exclude_fields: List[str] = None, hnsw_ef: int = None) -> tuple:
+        normalized_query = " ".join(str(query).lower().split())
+        filters_key = json.dumps(filters, sort_keys=True, default=str) if filters else None
+        projection_key = (tuple(sorted(include_fields or [])), tuple(sorted(exclude_fields or [])))
+        return collection_name, normalized_query, top_k, filters_key, projection_key, hnsw_ef
+
+    def invalidate_search_cache(self, collection_name: str = None):
+        """Drop cached search results of a collection (or of all collections)."""
+        if collection_name is None:
+            self.search_cache.clear()
+        else:
+            self.search_cache.invalidate(lambda key: key[0] == collection_name)
+
+    def search_cache_stats(self) -> dict:
+        return self.search_cache.stats()
+
+    def create_payload_indexes(self, collection_name, fields: dict):
+        """
+        Index payload fields so that filtered searches on them are fast.
+        :param fields: {field_name: PayloadSchemaType}
+        """
+        for field_name, field_schema in fields.items():
+            self.qdrant_client.create_payload_index(
                 collection_name=collection_name,
-                vectors_config=VectorParams(size=dim, distance=Distance.COSINE),
+                field_name=field_name,
+                field_schema=field_schema,
             )
 
     def insert_data(self, collection_name, data: List[tuple], id_col: str):
@@ -60,7 +249,7 @@ class DB:
         data (List[tuple]): List of tuples containing vectors and payloads.
         """
         data_points = []
-        for vector, payload in tqdm(data, desc=f"Inserting data into {collection_name}"):
+        for vector, payload in tqdm(data, desc=f"Inserting data into {collection_name}", disable=(not DEBUG_MODE)):
             data_points.append(
                 PointStruct(
                     id=convert_to_uuid(payload[id_col]),
@@ -69,24 +258,105 @@ class DB:
                 )
             )
 
-        self.qdrant_client.upsert(collection_name=collection_name, points=data_points)
+        # upsert in batches to keep each request small
+        for i in range(0, len(data_points), UPSERT_BATCH_SIZE):
+            self.qdrant_client.upsert(collection_name=collection_name, points=data_points[i:i + UPSERT_BATCH_SIZE])
+        self.invalidate_search_cache(collection_name)
 
-    def update_metadata(self, collection_name, item_id, new_metadata: dict):
+    def update_metadata(self, collection_name, item_id, new_metadata: dict, key: str = None, only_if: Filter = None):
+        """
+        Set payload fields of an item (other fields are kept).
+        :param key: optional nested payload path (e.g. "history.Math"); new_metadata is merged into the object
+            at that path on the server, so only the changed part is sent.
+        :param only_if: optional payload condition; the item is updated only if it matches (checked on the server,
+            atomically with the update).
+        """
         uuid_id = convert_to_uuid(item_id)
 
         self.qdrant_client.set_payload(
             collection_name=collection_name,
             payload=new_metadata,
-            points=[uuid_id]
+            points=[uuid_id] if only_if is None else Filter(must=[HasIdCondition(has_id=[uuid_id]), only_if]),
+            key=key,
         )
+        self.invalidate_search_cache(collection_name)
+
+    def update_metadata_many(self, collection_name, updates: List[tuple]):
+        """
+        Apply many set-payload updates in a single request.
+        :param updates: list of (item_id, new_metadata, key) or (item_id, new_metadata, key, only_if) tuples,
+            with the same meaning as in update_metadata.
+        """
+        operations = []
+        for item_id, new_metadata, key, *only_if in updates:
+            uuid_id = convert_to_uuid(item_id)
+            if only_if and only_if[0] is not None:
+                selector = {"filter": Filter(must=[HasIdCondition(has_id=[uuid_id]), only_if[0]])}
+            else:
+                selector = {"points": [uuid_id]}
+            operations.append(SetPayloadOperation(set_payload=SetPayload(payload=new_metadata, key=key, **selector)))
+        self._batch_update(collection_name, operations)
+
+    def _batch_update(self, collection_name, operations: list):
+        for i in range(0, len(operations), UPSERT_BATCH_SIZE):
+            self.qdrant_client.batch_update_points(collection_name=collection_name,
+                                                   update_operations=operations[i:i + UPSERT_BATCH_SIZE])
+        self.invalidate_search_cache(collection_name)
 
-    def get_items_data(self, collection_name, item_ids: List, id_col: str):
+    def update_or_insert(self, collection_name, item_id, default_payload: dict, id_col: str,
+                         extra_data: List[tuple] = None, extra_id_col: str = None) -> bool:
+        """
+        Make sure an item exists (inserting it with default_payload and a dummy vector of dim 1 if it does not),
+        together with extra points that are upserted in the same request.
+        The extra points must be idempotent (same id, same payload on every call, e.g. an enrollment point):
+        they never overwrite anything. The item itself is only upserted when it is missing, so an existing
+        item's payload is never replaced.
+        An existing item costs a single request; a new one three (the failed probe, the insert, and reading
+        back which caller's insert was kept).
+        :param extra_data: (vector, payload) tuples of the extra points, with their unique id in extra_id_col.
+        :return: True if this caller's insert created the item.
+        """
+        uuid_id = convert_to_uuid(item_id)
+        extra_points = [PointStruct(id=convert_to_uuid(payload[extra_id_col]), vector=vector, payload=payload)
+                        for vector, payload in extra_data or []]
+        extra_operations = [UpsertOperation(upsert=PointsList(points=extra_points))] if extra_points else []
+
+        # the probe (re-setting the item's own id) fails if the item is missing, and changes nothing otherwise
+        probe = SetPayloadOperation(set_payload=SetPayload(payload={id_col: item_id}, points=[uuid_id]))
+        try:
+            self._batch_update(collection_name, [probe] + extra_operations)
+            return False
+        except Exception as e:
+            if not is_not_found_error(e):
+                raise
+
+        # concurrent first inserts of the same item write the same payload; the token tells whose was kept
+        token = uuid.uuid4().hex
+        insert = UpsertOperation(upsert=PointsList(points=[
+            PointStruct(id=uuid_id, vector=[0.0], payload={**default_payload, INSERT_TOKEN_FIELD: token})
+        ] + extra_points))
+        try:
+            self._batch_update(collection_name, [insert])
+        except Exception as e:
+            if not is_not_found_error(e):
+                raise
+            self.create_collection(collection_name, dim=1)
+            self._batch_update(collection_name, [insert])
+        stored = (self.get_items_data(collection_name, [item_id], id_col, include_fields=[INSERT_TOKEN_FIELD])
+                  or {}).get(item_id) or {}
+        return stored.get(INSERT_TOKEN_FIELD) == token
+
+    def get_items_data(self, collection_name, item_ids: List, id_col: str, include_fields: List[str] = None):
+        """
+        Retrieve payloads by id, as {item_id: payload}.
+        :param include_fields: return only these payload fields (id_col is always included).
+        """
         uuid_ids = [convert_to_uuid(item_id) for item_id in item_ids]
 
         results = self.qdrant_client.retrieve(
             collection_name=collection_name,
             ids=uuid_ids,
-            with_payload=True,
+            with_payload=build_payload_selector(include_fields + [id_col]) if include_fields else True,
             with_vectors=False
         )
 
@@ -95,17 +365,28 @@ class DB:
 
         return None
 
-    def clean_collection(self, collection_name, vector_dim=384):
+    def get_existing_ids(self, collection_name, item_ids: List) -> set:
+        """Return the subset of item_ids that already exist in the collection (payloads are not fetched)."""
+        uuid_to_id = {convert_to_uuid(item_id): item_id for item_id in item_ids}
+
+        results = self.qdrant_client.retrieve(
+            collection_name=collection_name,
+            ids=list(uuid_to_id),
+            with_payload=False,
+            with_vectors=False
+        )
+        return {uuid_to_id[str(item.id)] for item in results}
+
+    def clean_collection(self, collection_name, vector_dim=384, config: dict = None):
         """
         Clean the specified Qdrant collection by deleting all its vectors.
         :param collection_name: The name of the collection to clean.
         :param vector_dim: The dimensionality of the vectors in the collection.
+        :param config: storage / index options of the recreated collection, see create_collection.
         """
         self.qdrant_client.delete_collection(collection_name=collection_name)
-        self.qdrant_client.create_collection(
-            collection_name=collection_name,
-            vectors_config=VectorParams(size=vector_dim, distance=Distance.COSINE),
-        )
+        self.invalidate_search_cache(collection_name)
+        self._create_collection(collection_name, vector_dim, config)
         logger.info(f"Collection '{collection_name}' has been cleaned and recreated.")
 
 
@@ -116,6 +397,7 @@ class DB:
         collections = self.qdrant_client.get_collections()
         for collection in collections.collections:
             self.qdrant_client.delete_collection(collection_name=collection.name)
+            self.invalidate_search_cache(collection.name)
             logger.info(f"Collection '{collection.name}' has been deleted.")
             
     def delete_collection(self, collection_name: str):
@@ -124,6 +406,7 @@ class DB:
         :param collection_name: The name of the collection to delete.
         """
         self.qdrant_client.delete_collection(collection_name=collection_name)
+        self.invalidate_search_cache(collection_name)
         logger.info(f"Collection '{collection_name}' has been deleted.")
 
     def print_collections(self):
@@ -141,41 +424,203 @@ class DB:
         size = self.qdrant_client.count(collection_name=collection_name)
         print(f"Collection '{collection_name}' size: {size}")
 
-    def search_by_query_vec(self, collection_name: str, query: str, top_k: int = 5) -> list[str]:
+    def search_by_query_vec(self, collection_name: str, query: str, top_k: int = 5, filters: dict = None,
+                            include_fields: List[str] = None, exclude_fields: List[str] = None,
+                            hnsw_ef: int = None) -> list[str]:
+        """
+        Semantic search for the query. Results are cached (LRU + TTL) until the collection is modified.
+        :param filters: optional {field: value} payload filter, see build_filter.
+        :param include_fields: return only these payload fields.
+        :param exclude_fields: return all payload fields except these (ignored if include_fields is given).
+        :param hnsw_ef: search-time HNSW beam size (higher = better recall, slower), defaults to the collection config.
+        """
+        cache_key = self._search_cache_key(collection_name, query, top_k, filters, include_fields, exclude_fields, hnsw_ef)
+        cached = self.search_cache.get(cache_key)
+        if cached is not None:
+            return copy.deepcopy(cached)
+
         vecs, _ = self.embeder_client.embed([query])
         vec = vecs[0] # need only one vector for the query
-        results = self.qdrant_client.search(collection_name=collection_name, query_vector=vec, limit=top_k)
-        return [result.payload for result in results]
+        results = self.qdrant_client.search(
+            collection_name=collection_name,
+            query_vector=vec,
+            query_filter=build_filter(filters),
+            limit=top_k,
+            with_payload=build_payload_selector(include_fields, exclude_fields),
+            search_params=_search_params(_get_collection_config(collection_name), hnsw_ef),
+        )
+        payloads = [result.payload for result in results]
+        self.search_cache.set(cache_key, payloads)
+        return copy.deepcopy(payloads)
 
-# --- singleton instance + accessor ---
-_DB_SINGLETON = DB()
+    def search_many(self, collection_name: str, queries: List[str], top_k: int = 5, filters: dict = None,
+                    include_fields: List[str] = None, exclude_fields: List[str] = None,
+                    hnsw_ef: int = None) -> List[List[dict]]:
+        """
+        Search several queries at once: all (non cached) queries are embedded together and sent as one batch search.
+        :param filters: optional {field: value} payload filter applied to all queries, see build_filter.
+        :param include_fields: return only these payload fields.
+        :param exclude_fields: return all payload fields except these (ignored if include_fields is given).
+        :param hnsw_ef: search-time HNSW beam size, defaults to the collection config.
+        :return: a list of payload lists, aligned with queries.
+        """
+        cache_keys = [self._search_cache_key(collection_name, query, top_k, filters, include_fields, exclude_fields, hnsw_ef)
+                      for query in queries]
+        results = [self.search_cache.get(cache_key) for cache_key in cache_keys]
+        missing = [i for i, result in enumerate(results) if result is None]
 
-def get_db_object():
+        if missing:
+            vecs, _ = self.embeder_client.embed([queries[i] for i in missing])
+            query_filter = build_filter(filters)
+            with_payload = build_payload_selector(include_fields, exclude_fields)
+            search_params = _search_params(_get_collection_config(collection_name), hnsw_ef)
+            batch_results = self.qdrant_client.search_batch(
+                collection_name=collection_name,
+                requests=[SearchRequest(vector=vec, filter=query_filter, limit=top_k, with_payload=with_payload,
+                                        params=search_params)
+                          for vec in vecs],
+            )
+            for i, points in zip(missing, batch_results):
+                results[i] = [point.payload for point in points]
+                self.search_cache.set(cache_keys[i], results[i])
+
+        return copy.deepcopy(results)
+
+# --- lazy singleton instance + accessor ---
+_DB_SINGLETON = None
+_DB_SINGLETON_LOCK = threading.Lock()
+
+def get_db_object() -> DB:
+    """Return the shared DB object, creating it on first use."""
+    global _DB_SINGLETON
+    if _DB_SINGLETON is None:
+        with _DB_SINGLETON_LOCK:
+            if _DB_SINGLETON is None:
+                _DB_SINGLETON = DB()
     return _DB_SINGLETON
 
 
-def index_df(df, index_by_col: str, need_to_embed_col: bool, id_col: str, collection_name: str):
+def _get_checkpoint_path(collection_name: str, ids: List):
+    """Checkpoint file for indexing these ids into this collection."""
+    fingerprint = hashlib.sha256("\n".join(map(str, ids)).encode("utf-8")).hexdigest()[:16]
+    return get_cache_folder() / "index_checkpoints" / f"{collection_name}_{fingerprint}.json"
+
+
+def _load_checkpoint(checkpoint_path) -> int:
+    if checkpoint_path.exists():
+        return json.loads(checkpoint_path.read_text())["next_row"]
+    return 0
+
+
+def _save_checkpoint(checkpoint_path, next_row: int):
+    checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+    checkpoint_path.write_text(json.dumps({"next_row": next_row}))
+
+
+def index_df(df, index_by_col: str, need_to_embed_col: bool, id_col: str, collection_name: str,
+             chunk_size: int = INDEX_CHUNK_SIZE, skip_existing: bool = True, resume: bool = True,
+             collection_config: dict = None):
     """
     Index the data in the DataFrame into a Qdrant collection.
+    Rows are embedded and upserted chunk by chunk, so memory stays bounded for large DataFrames.
+    Progress is checkpointed to disk, so an interrupted run of the same DataFrame resumes where it stopped.
     :param df: DataFrame containing the data to index.
     :param index_by_col: Column name to use for indexing.
+    :param need_to_embed_col: Whether to embed index_by_col (otherwise a dummy vector of dim 1 is stored).
+    :param id_col: Column with the unique id of each row.
     :param collection_name: Name of the Qdrant collection to create or use.
-    :param dim: Dimensionality of the vectors in the collection.
+    :param chunk_size: Number of rows embedded and upserted together.
+    :param skip_existing: Skip rows whose id already exists in the collection.
+    :param resume: Resume from (and write) a checkpoint file.
+    :param collection_config: storage / index options if the collection is created, see DB.create_collection.
     """
-    # embed indexed col
-    if need_to_embed_col:
-        embeder_client = get_embedding_object()
-        vectors, dim = embeder_client.embed(df[index_by_col].tolist())
-    else:
-        # vectors os just a list of zeros
-        dim = 1
-        vectors = [[0.0] * dim for _ in range(len(df))]
-    
-    db = DB()
-    db.create_collection(collection_name, dim)
-    db.insert_data(collection_name, list(zip(vectors, df.to_dict(orient='records'))), id_col=id_col)
+    db = get_db_object()
+    n_rows = len(df)
+    collection_exists = db.qdrant_client.collection_exists(collection_name)
+
+    # a checkpoint is only needed when the work spans several chunks
+    checkpoint_path = None
+    if resume and n_rows > chunk_size:
+        checkpoint_path = _get_checkpoint_path(collection_name, df[id_col].tolist())
+    start_row = _load_checkpoint(checkpoint_path) if checkpoint_path else 0
+    if start_row:
+        logger.info(f"Resuming indexing of '{collection_name}' from row {start_row} / {n_rows}")
+
+    for start in tqdm(range(start_row, n_rows, chunk_size), desc=f"Indexing {collection_name}", disable=(not DEBUG_MODE)):
+        chunk = df.iloc[start:start + chunk_size]
+
+        if skip_existing and collection_exists:
+            existing_ids = db.get_existing_ids(collection_name, chunk[id_col].tolist())
+            chunk = chunk[~chunk[id_col].isin(existing_ids)]
+
+        if len(chunk):
+            # embed indexed col
+            if need_to_embed_col:
+                vectors, dim = get_embedding_object().embed(chunk[index_by_col].tolist())
+            else:
+                # vectors os just a list of zeros
+                dim = 1
+                vectors = [[0.0] * dim for _ in range(len(chunk))]
+
+            if not collection_exists:
+                db.create_collection(collection_name, dim, config=collection_config)
+                collection_exists = True
+            db.insert_data(collection_name, list(zip(vectors, chunk.to_dict(orient='records'))), id_col=id_col)
+
+        if checkpoint_path:
+            _save_checkpoint(checkpoint_path, start + chunk_size)
+
+    if checkpoint_path:
+        checkpoint_path.unlink(missing_ok=True)
     db.print_collection_size(collection_name)
 
+def _to_unified_question_payload(payload: dict, course: str, source_collection: str) -> dict:
+    # filter values are matched exactly: stored lowercased, and lowercased by the searches too
+    topic_value = str(payload.get(COURSE_TO_TOPIC_FIELD[course], "unknown")).strip().lower()
+    return {
+        **payload,
+        UNIFIED_QUESTIONS_ID_COL: f"{course}: {payload['question_description']}",
+        "course": course,
+        "module": topic_value,
+        # Math modules look like "algebra__linear_1d" - the topic is the part before "__"
+        "topic": topic_value.split("__")[0],
+        "difficulty": str(payload.get("difficulty", "unknown")).strip().lower(),
+        "source": source_collection,
+    }
+
+
+def build_unified_questions_collection(batch_size: int = UPSERT_BATCH_SIZE):
+    """
+    Copy the questions of all per-course collections into UNIFIED_QUESTIONS_COLLECTION,
+    with normalized course/topic/module/difficulty/source fields, and index these fields.
+    Vectors are copied as-is, so nothing is re-embedded.
+    """
+    db = get_db_object()
+    for course, source_collection in COURSE_TO_COLLECTION_NAME.items():
+        if not db.qdrant_client.collection_exists(source_collection):
+            logger.warning(f"Collection '{source_collection}' does not exist, skipping {course}.")
+            continue
+        offset = None
+        while True:
+            points, offset = db.qdrant_client.scroll(
+                collection_name=source_collection,
+                limit=batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=True,
+            )
+            if points:
+                db.create_collection(UNIFIED_QUESTIONS_COLLECTION, dim=len(points[0].vector))
+                data = [(point.vector, _to_unified_question_payload(point.payload, course, source_collection))
+                        for point in points]
+                db.insert_data(UNIFIED_QUESTIONS_COLLECTION, data, id_col=UNIFIED_QUESTIONS_ID_COL)
+            if offset is None:
+                break
+
+    db.create_payload_indexes(UNIFIED_QUESTIONS_COLLECTION, QUESTION_PAYLOAD_INDEXES)
+    db.print_collection_size(UNIFIED_QUESTIONS_COLLECTION)
+
+
 def _get_studens_DB_for_test():
     students = [
         (
@@ -218,7 +663,7 @@ def _test_index_df():
 
 def _test_search_by_query_vec():    
     query = "Bye Bye"
-    db = DB()
+    db = get_db_object()
     results = db.search_by_query_vec(collection_name="test_collection", query=query, top_k=2)
     print(f"Search results for query '{query}': \n{results}")
     logger.debug("Search completed successfully.")
@@ -1,12 +1,15 @@
 
 from src.agent.main_private_teacher import init_private_teacher
-from src.utils.user_response import get_student_response
+from src.utils.user_response import get_student_response, display_message
+from src.utils.LLM_utils import LLM_CALLS
+from src.utils.token_quota import quota_scope, get_quota_state, TokenQuotaExceeded
 from src.agent.prompts import WELCOME_PROMPT, USER_REQUEST_PROMPT
 from src.agent.student_evaluator import  _ensure_student_exists
-from src.utils.constants import VALID_COURSES
+from src.utils.constants import VALID_COURSES, DEBUG_MODE
 
 # Ignore all DeprecationWarnings from langchain
 import os
+import uuid
 import warnings
 from pydantic.warnings import PydanticDeprecatedSince20
 os.environ.setdefault("PYTHONWARNINGS", "ignore::DeprecationWarning")
@@ -26,8 +29,17 @@ def run_private_teacher_agent():
     student_id = _ensure_student_exists(name=name, course=course, student_id=student_id)
     user_message = get_student_response(USER_REQUEST_PROMPT.format(name=name, course=course))
 
-    agent, prompt_text = init_private_teacher(student_id, course, user_message)
-    agent.run(prompt_text)
+    # all LLM calls of the lesson are charged to its session and to the student (see src/utils/token_quota.py)
+    with quota_scope(session_id=uuid.uuid4().hex, student_id=student_id):
+        try:
+            agent, prompt_text = init_private_teacher(student_id, course, user_message)
+            agent.run(prompt_text)
+        except TokenQuotaExceeded:
+            display_message("We have reached the end of today's lesson time. Great work, see you next time!")
+            if DEBUG_MODE:
+                print(f"Token quota state: {get_quota_state()}")
+        if DEBUG_MODE:
+            print(f"LLM calls (latency, retries, hedges): {LLM_CALLS.stats()}")
 
 if __name__ == "__main__":
     run_private_teacher_agent()
@@ -1,37 +1,412 @@
 from langchain_community.chat_models import AzureChatOpenAI
-from openai import AzureOpenAI
-from typing import Optional, List
+from openai import AzureOpenAI, APIStatusError, APIConnectionError, BadRequestError
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Iterator, NamedTuple, Optional, List
 
+import httpx
 from pydantic import Field
 from tqdm import tqdm
+from loguru import logger
 from langchain.schema import SystemMessage, HumanMessage, BaseMessage
-from src.utils.constants import EMBEDDING_DEPLOYMENT_NAME, AZURE_OPENAI_ENDPOINT, API_VERSION, EMBEDDING_MODEL, DEBUG_MODE
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+from src.utils.constants import (
+    EMBEDDING_DEPLOYMENT_NAME, AZURE_OPENAI_ENDPOINT, API_VERSION, EMBEDDING_MODEL, DEBUG_MODE,
+    EMBEDDING_BATCH_MAX_ITEMS, EMBEDDING_BATCH_MAX_TOKENS, EMBEDDING_MAX_CONCURRENCY,
+    EMBEDDING_MAX_RETRIES, EMBEDDING_BACKOFF_BASE_SECONDS, EMBEDDING_BACKOFF_MAX_SECONDS,
+    EMBEDDING_CACHE_ENABLED, EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES,
+    EMBEDDING_PROVIDER, EMBEDDING_DIM, LLM_RESPONSE_CACHE_ENABLED, LLM_RESPONSE_CACHE_PATH,
+    LLM_RESPONSE_CACHE_TTL_SECONDS, LLM_RESPONSE_CACHE_MAX_ENTRIES, LLM_RESPONSE_CACHE_HIT_SUFFIX,
+    CHAT_DEPLOYMENT_NAME, LLM_HTTP_MAX_CONNECTIONS, LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    LLM_HTTP_KEEPALIVE_EXPIRY_SECONDS, LLM_HTTP_TIMEOUT_SECONDS, LLM_HTTP_CONNECT_TIMEOUT_SECONDS,
+    LLM_STREAM_USAGE, PROMPT_TOKENIZER_ENCODING, PROMPT_TOKEN_BUDGETS, PROMPT_TOKEN_BUDGET_DEFAULT,
+    QUOTA_DEGRADED_CONTEXT_RATIO, LLM_CASSETTE_MODE, LLM_CASSETTE_PATH, LLM_CASSETTE_LATENCY_SCALE,
+    LLM_CASSETTE_LATENCY_SECONDS, LLM_DEADLINES_SECONDS, LLM_DEADLINE_SECONDS_DEFAULT, LLM_MAX_RETRIES,
+    LLM_BACKOFF_BASE_SECONDS, LLM_BACKOFF_MAX_SECONDS, LLM_HEDGING_ENABLED, LLM_HEDGE_PERCENTILE,
+    LLM_HEDGE_MIN_SAMPLES, LLM_HEDGE_WASTED_SUFFIX
+)
 from src.utils.tokens_counter import log_token_count_to_csv
+from src.utils.embedding_cache import EmbeddingCache
+from src.utils.response_cache import ResponseCache
+from src.utils.cassette import CassetteTransport, CASSETTE_OFF, CASSETTE_REPLAY
+from src.utils.token_quota import charge_tokens, check_quota, get_quota_scope, is_quota_degraded
+from src.utils.folders_utils import get_cache_folder, get_repo_folder
 from dotenv import load_dotenv
+from functools import lru_cache
 import os
+import hashlib
+import math
+import random
+import threading
+import time
 
 load_dotenv()
 
+
+def is_retryable_error(error: Exception) -> bool:
+    """Connection errors, rate limits (429) and server errors (5xx) are worth retrying."""
+    if isinstance(error, APIConnectionError):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+def get_retry_delay(error: Exception, attempt: int,
+                    base: float = EMBEDDING_BACKOFF_BASE_SECONDS, cap: float = EMBEDDING_BACKOFF_MAX_SECONDS) -> float:
+    """
+    Seconds to wait before the next attempt.
+    Honors the server's Retry-After (or retry-after-ms) header, otherwise uses jittered exponential backoff.
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms") is not None:
+            return min(cap, float(headers["retry-after-ms"]) / 1000)
+        if headers.get("retry-after") is not None:
+            return min(cap, float(headers["retry-after"]))
+    except ValueError:
+        pass  # e.g. an HTTP-date Retry-After, fall back to backoff
+    return min(cap, base * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+
+# ----------------------
+# Prompt size estimation and budgets
+# ----------------------
+@lru_cache(maxsize=1)
+def get_tokenizer():
+    """The chat model's tiktoken encoding, or None if tiktoken (or its encoding file) is unavailable."""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(PROMPT_TOKENIZER_ENCODING)
+    except Exception as e:
+        logger.warning(f"Local tokenizer unavailable ({e}), estimating ~4 characters per token.")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        return len(text) // 4 + 1
+    return len(tokenizer.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages: List[BaseMessage]) -> int:
+    """Estimated prompt tokens of a chat request (~4 tokens of framing per message, 3 to prime the reply)."""
+    return sum(count_tokens(str(m.content)) + 4 for m in messages) + 3
+
+
+def truncate_tokens(text: str, max_tokens: int, keep: str = "head") -> str:
+    """Cut text to max_tokens, keeping its beginning ("head") or its end ("tail")."""
+    if max_tokens <= 0:
+        return ""
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        max_chars = max_tokens * 4
+        return text[:max_chars] if keep == "head" else text[-max_chars:]
+    tokens = tokenizer.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return tokenizer.decode(tokens[:max_tokens] if keep == "head" else tokens[-max_tokens:])
+
+
+class PromptSection(NamedTuple):
+    """A trimmable part of a prompt (see build_prompt)."""
+    text: str
+    priority: int = 1  # sections with a higher priority are trimmed first; 0 = never trimmed
+    keep: str = "head"  # which end survives trimming: "head" (e.g. long snippets) or "tail" (e.g. old history)
+
+
+TRIMMED_MARK = "[...]"
+
+
+def build_prompt(agent_name: str, template: str, prefix: str = "", budget: int = None, **fields) -> str:
+    """
+    Return prefix + template.format(**fields), fitted to the agent's token budget (PROMPT_TOKEN_BUDGETS).
+    Fields given as PromptSection are trimmed, lowest priority first, until the prompt fits;
+    other fields and the prefix (e.g. a system prompt, not formatted) are kept as they are.
+    Close to the session / student token quota the budget is reduced (QUOTA_DEGRADED_CONTEXT_RATIO).
+    """
+    budget = budget or PROMPT_TOKEN_BUDGETS.get(agent_name, PROMPT_TOKEN_BUDGET_DEFAULT)
+    if is_quota_degraded():
+        budget = int(budget * QUOTA_DEGRADED_CONTEXT_RATIO)
+    texts = {name: str(value.text if isinstance(value, PromptSection) else value) for name, value in fields.items()}
+    n_tokens = count_tokens(prefix + template.format(**texts))
+    n_tokens_before = n_tokens
+
+    sections = sorted(
+        ((name, value) for name, value in fields.items() if isinstance(value, PromptSection) and value.priority > 0),
+        key=lambda item: -item[1].priority,
+    )
+    for name, section in sections:
+        if n_tokens <= budget:
+            break
+        section_tokens = count_tokens(texts[name])
+        keep_tokens = section_tokens - (n_tokens - budget) - count_tokens(f" {TRIMMED_MARK}")
+        if keep_tokens <= 0:
+            texts[name] = ""
+        elif section.keep == "head":
+            texts[name] = f"{truncate_tokens(texts[name], keep_tokens, 'head')} {TRIMMED_MARK}"
+        else:
+            texts[name] = f"{TRIMMED_MARK} {truncate_tokens(texts[name], keep_tokens, 'tail')}"
+        n_tokens = count_tokens(prefix + template.format(**texts))
+
+    if n_tokens != n_tokens_before:
+        logger.info(f"{agent_name}: prompt trimmed from {n_tokens_before} to {n_tokens} tokens (budget {budget}).")
+    if n_tokens > budget:
+        logger.warning(f"{agent_name}: prompt of {n_tokens} tokens exceeds its budget of {budget} tokens.")
+    return prefix + template.format(**texts)
+
+
+class PromptEstimateMonitor:
+    """Estimated (local tokenizer) vs. actual (API usage) prompt tokens per agent, to watch estimator drift."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {}  # agent_name -> [n_requests, estimated_tokens, actual_tokens]
+
+    def record(self, agent_name: str, estimated_tokens: int, actual_tokens: int):
+        if actual_tokens is None:
+            return
+        with self._lock:
+            totals = self._totals.setdefault(agent_name, [0, 0, 0])
+            totals[0] += 1
+            totals[1] += estimated_tokens
+            totals[2] += actual_tokens
+        logger.debug(f"{agent_name}: estimated {estimated_tokens} prompt tokens, actual {actual_tokens}.")
+
+    def stats(self) -> dict:
+        """Per agent: requests, estimated and actual prompt tokens, and drift (actual / estimated - 1)."""
+        with self._lock:
+            return {
+                agent_name: {
+                    "requests": n_requests,
+                    "estimated_tokens": estimated,
+                    "actual_tokens": actual,
+                    "drift": round(actual / estimated - 1, 4) if estimated else None,
+                }
+                for agent_name, (n_requests, estimated, actual) in self._totals.items()
+            }
+
+
+PROMPT_ESTIMATES = PromptEstimateMonitor()
+
+
+# ----------------------
+# LLM call resilience
+# ----------------------
+class LLMCallMonitor:
+    """Per agent: recent latencies (for the hedging threshold) and counters of retries, hedges and wasted tokens."""
+
+    def __init__(self, window: int = 200):
+        self._lock = threading.Lock()
+        self._latencies = {}  # agent_name -> deque of seconds
+        self._counters = {}  # agent_name -> {counter: value}
+        self.window = window
+
+    def record_latency(self, agent_name: str, seconds: float):
+        with self._lock:
+            self._latencies.setdefault(agent_name, deque(maxlen=self.window)).append(seconds)
+
+    def increment(self, agent_name: str, counter: str, value: int = 1):
+        with self._lock:
+            counters = self._counters.setdefault(agent_name, {})
+            counters[counter] = counters.get(counter, 0) + value
+
+    def percentile(self, agent_name: str, q: float) -> Optional[float]:
+        """The q-quantile of the agent's recent latencies, or None with fewer than LLM_HEDGE_MIN_SAMPLES samples."""
+        with self._lock:
+            latencies = sorted(self._latencies.get(agent_name, ()))
+        if len(latencies) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    def stats(self) -> dict:
+        """Per agent: calls, p50 / p95 / p99 latency and the retries, hedges, hedge wins, timeouts and wasted tokens."""
+        with self._lock:
+            agents = set(self._latencies) | set(self._counters)
+            latencies = {agent_name: sorted(self._latencies.get(agent_name, ())) for agent_name in agents}
+            counters = {agent_name: dict(self._counters.get(agent_name, {})) for agent_name in agents}
+
+        def quantile(values, q):
+            return round(values[min(len(values) - 1, int(q * len(values)))], 3) if values else None
+
+        return {
+            agent_name: {
+                "calls": len(latencies[agent_name]),
+                "p50": quantile(latencies[agent_name], 0.5),
+                "p95": quantile(latencies[agent_name], 0.95),
+                "p99": quantile(latencies[agent_name], 0.99),
+                **counters[agent_name],
+            }
+            for agent_name in sorted(agents)
+        }
+
+
+LLM_CALLS = LLMCallMonitor()
+
+# attempts run on this pool so that the caller can stop waiting at the deadline / send a hedged request
+_LLM_CALL_EXECUTOR = ThreadPoolExecutor(max_workers=LLM_HTTP_MAX_CONNECTIONS, thread_name_prefix="llm-call")
+
+
+# --- lazy singleton HTTP client + accessor ---
+_HTTP_CLIENT_SINGLETON = None
+_HTTP_CLIENT_SINGLETON_LOCK = threading.Lock()
+
+def get_http_client() -> httpx.Client:
+    """
+    Return the HTTP client shared by all LLM and embedding clients, creating it on first use.
+    A single keep-alive connection pool means TLS handshakes to the Azure endpoint are paid once, not per agent.
+    With LLM_CASSETTE_MODE set, requests go through a CassetteTransport (record / replay, see src/utils/cassette.py).
+    """
+    global _HTTP_CLIENT_SINGLETON
+    if _HTTP_CLIENT_SINGLETON is None:
+        with _HTTP_CLIENT_SINGLETON_LOCK:
+            if _HTTP_CLIENT_SINGLETON is None:
+                transport = httpx.HTTPTransport(limits=httpx.Limits(
+                    max_connections=LLM_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=LLM_HTTP_KEEPALIVE_EXPIRY_SECONDS,
+                ))
+                if LLM_CASSETTE_MODE != CASSETTE_OFF:
+                    transport = CassetteTransport(
+                        LLM_CASSETTE_PATH or get_repo_folder() / "cassettes" / "default",
+                        mode=LLM_CASSETTE_MODE,
+                        inner=transport,
+                        latency_scale=LLM_CASSETTE_LATENCY_SCALE,
+                        latency_seconds=LLM_CASSETTE_LATENCY_SECONDS,
+                    )
+                    logger.info(f"LLM cassette: {LLM_CASSETTE_MODE} '{transport.path}'")
+                _HTTP_CLIENT_SINGLETON = httpx.Client(
+                    transport=transport,
+                    timeout=httpx.Timeout(LLM_HTTP_TIMEOUT_SECONDS, connect=LLM_HTTP_CONNECT_TIMEOUT_SECONDS),
+                )
+    return _HTTP_CLIENT_SINGLETON
+
+
+def get_api_key() -> Optional[str]:
+    """The Azure OpenAI API key; replaying a cassette needs none, a placeholder is used."""
+    api_key = os.getenv("OPENAI_API_KEY")
+    if api_key is None and LLM_CASSETTE_MODE == CASSETTE_REPLAY:
+        return "cassette-replay"
+    return api_key
+
+
+# --- lazy singleton response cache + accessor ---
+_RESPONSE_CACHE_SINGLETON = None
+_RESPONSE_CACHE_SINGLETON_LOCK = threading.Lock()
+
+def get_response_cache() -> ResponseCache:
+    """Return the shared LLM response cache, creating it on first use."""
+    global _RESPONSE_CACHE_SINGLETON
+    if _RESPONSE_CACHE_SINGLETON is None:
+        with _RESPONSE_CACHE_SINGLETON_LOCK:
+            if _RESPONSE_CACHE_SINGLETON is None:
+                _RESPONSE_CACHE_SINGLETON = ResponseCache(
+                    LLM_RESPONSE_CACHE_PATH or get_cache_folder() / "llm_responses_cache.sqlite",
+                    max_entries=LLM_RESPONSE_CACHE_MAX_ENTRIES,
+                    ttl=LLM_RESPONSE_CACHE_TTL_SECONDS,
+                )
+    return _RESPONSE_CACHE_SINGLETON
+
+
+# set to False (for the process) once the API rejects stream_options, see LoggingAzureChatOpenAI.stream_tokens
+_STREAM_USAGE_SUPPORTED = LLM_STREAM_USAGE
+
+# generate() kwargs that do not change the generated answer
+_NON_REQUEST_KWARGS = ("callbacks", "tags", "metadata", "run_name", "run_id")
+
+
 class LoggingAzureChatOpenAI(AzureChatOpenAI):
     agent_name: Optional[str] = Field(default="default_agent")
+    # answer identical temperature=0 requests from the response cache (see LLM_RESPONSE_CACHE_*)
+    use_response_cache: bool = Field(default=LLM_RESPONSE_CACHE_ENABLED)
+
+    def _response_cache_key(self, message_list: List[BaseMessage], kwargs: dict) -> str:
+        params = {
+            "model_name": self.model_name,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "n": self.n,
+            "model_kwargs": self.model_kwargs,
+            # None kwargs (e.g. generate's stop=None) are the defaults: streamed and generated calls share entries
+            **{key: value for key, value in kwargs.items() if key not in _NON_REQUEST_KWARGS and value is not None},
+        }
+        messages = [{"type": m.type, "content": m.content, **m.additional_kwargs} for m in message_list]
+        return ResponseCache.make_key(self.deployment_name, messages, params)
+
+    def _log_item(self, agent_name: str, message_list: List[BaseMessage], generated_answer: str,
+                  prompt_tokens, completion_tokens):
+        # Extract system and user messages
+        system_prompts = [m.content for m in message_list if isinstance(m, SystemMessage)]
+        user_prompts = [m.content for m in message_list if isinstance(m, HumanMessage)]
+
+        # Join if multiple system or user prompts exist
+        system_prompt_text = "\n".join(system_prompts)
+        user_prompt_text = "\n".join(user_prompts)
+
+        union_prompt = f"System: {system_prompt_text}\nUser: {user_prompt_text}"
+
+        # Log
+        log_token_count_to_csv(
+            agent_name,
+            union_prompt,
+            generated_answer,
+            prompt_tokens,
+            completion_tokens
+        )
 
     def generate(self, messages: list[list[BaseMessage]], **kwargs):
         """
         messages: A list of lists (batch), each containing LangChain message objects
         """
-        # Call the original generate
-        response = super().generate(messages, **kwargs)
+        if not (self.use_response_cache and self.temperature == 0):
+            return self._generate_and_log(messages, **kwargs)
 
-        # Go over each batch item
+        # Only the batch items that are not cached are sent
+        cache = get_response_cache()
+        keys = [self._response_cache_key(message_list, kwargs) for message_list in messages]
+        cached = cache.get_many(self.agent_name, keys)
+        missing = [idx for idx, key in enumerate(keys) if key not in cached]
+
+        llm_output = {}
+        if missing:
+            response = self._generate_and_log([messages[idx] for idx in missing], **kwargs)
+            llm_output = response.llm_output or {}
+            for idx, generations in zip(missing, response.generations):
+                cached[keys[idx]] = [
+                    {"text": generation.text, "generation_info": generation.generation_info}
+                    for generation in generations
+                ]
+                cache.put(self.agent_name, keys[idx], cached[keys[idx]])
+
+        # Cache hits cost no tokens; they are logged under a marked agent name for hit-rate accounting
+        missing = set(missing)
         for idx, message_list in enumerate(messages):
-            # Extract system and user messages
-            system_prompts = [m.content for m in message_list if isinstance(m, SystemMessage)]
-            user_prompts = [m.content for m in message_list if isinstance(m, HumanMessage)]
+            if idx not in missing:
+                self._log_item(f"{self.agent_name}{LLM_RESPONSE_CACHE_HIT_SUFFIX}", message_list,
+                               str(cached[keys[idx]][0]["text"]), 0, 0)
+
+        generations = [
+            [ChatGeneration(message=AIMessage(content=item["text"]), generation_info=item["generation_info"])
+             for item in cached[key]]
+            for key in keys
+        ]
+        return LLMResult(generations=generations, llm_output=llm_output)
 
-            # Join if multiple system or user prompts exist
-            system_prompt_text = "\n".join(system_prompts)
-            user_prompt_text = "\n".join(user_prompts)
+    def _generate_and_log(self, messages: list[list[BaseMessage]], **kwargs):
+        check_quota(self.agent_name)
+        estimated_prompt_tokens = sum(count_message_tokens(message_list) for message_list in messages)
 
+        # Call the original generate (with deadline, retries and hedging)
+        response = self._generate_resilient(messages, **kwargs)
+        batch_usage = (response.llm_output or {}).get("token_usage", {})
+        charge_tokens((batch_usage.get("prompt_tokens") or 0) + (batch_usage.get("completion_tokens") or 0))
+        PROMPT_ESTIMATES.record(self.agent_name, estimated_prompt_tokens, batch_usage.get("prompt_tokens"))
+
+        # Go over each batch item
+        for idx, message_list in enumerate(messages):
             # Token usage (LangChain's ChatResult)
             token_usage = response.llm_output.get("token_usage", {})
             prompt_tokens = token_usage.get("prompt_tokens", None)
@@ -40,52 +415,401 @@ class LoggingAzureChatOpenAI(AzureChatOpenAI):
             # Generated answer
             generated_answer = str(response.generations[idx][0].text)
 
-            union_prompt = f"System: {system_prompt_text}\nUser: {user_prompt_text}"
-
-            # Log
-            log_token_count_to_csv(
-                self.agent_name,
-                union_prompt,
-                generated_answer,
-                prompt_tokens,
-                completion_tokens
-            )
+            self._log_item(self.agent_name, message_list, generated_answer, prompt_tokens, completion_tokens)
 
         return response
 
+    def _deadline(self) -> float:
+        """time.monotonic() by which the agent's call must be answered, retries included (LLM_DEADLINES_SECONDS)."""
+        return time.monotonic() + LLM_DEADLINES_SECONDS.get(self.agent_name, LLM_DEADLINE_SECONDS_DEFAULT)
+
+    def _with_retries(self, call, deadline: float):
+        """
+        Return call(), retrying retryable errors and attempts cut by the deadline with jittered backoff
+        while time is left before the deadline.
+        """
+        attempt = 0
+        while True:
+            try:
+                return call()
+            except Exception as e:
+                remaining = deadline - time.monotonic()
+                if not (is_retryable_error(e) or isinstance(e, TimeoutError)) or attempt >= LLM_MAX_RETRIES \
+                        or remaining <= 0:
+                    raise
+                delay = min(remaining, get_retry_delay(e, attempt, LLM_BACKOFF_BASE_SECONDS, LLM_BACKOFF_MAX_SECONDS))
+                LLM_CALLS.increment(self.agent_name, "retries")
+                logger.warning(f"{self.agent_name}: LLM request failed ({e.__class__.__name__}), "
+                               f"retry {attempt + 1} in {delay:.1f}s")
+                time.sleep(delay)
+                attempt += 1
 
-class LoggingEmbedding:
+    def _generate_resilient(self, messages: list[list[BaseMessage]], **kwargs):
+        """The original generate, with the agent's deadline, retries and hedging."""
+        deadline = self._deadline()
+        return self._with_retries(lambda: self._hedged_attempt(messages, deadline, **kwargs), deadline)
 
-    def __init__(self):
+    def _hedged_attempt(self, messages: list[list[BaseMessage]], deadline: float, **kwargs):
+        """
+        One attempt, waited for until the deadline. With hedging enabled, a duplicate request is sent once the
+        attempt takes longer than the agent's p95 latency, and the first answer wins.
+        """
+        # read here: the tokens of losing requests are charged from the executor's threads
+        quota_scope = get_quota_scope()
+        start = time.monotonic()
+        futures = [_LLM_CALL_EXECUTOR.submit(super().generate, messages, **kwargs)]
+
+        hedge_after = LLM_CALLS.percentile(self.agent_name, LLM_HEDGE_PERCENTILE) if LLM_HEDGING_ENABLED else None
+        if hedge_after is not None and start + hedge_after < deadline:
+            done, _ = wait(futures, timeout=hedge_after)
+            if not done:
+                LLM_CALLS.increment(self.agent_name, "hedges")
+                futures.append(_LLM_CALL_EXECUTOR.submit(super().generate, messages, **kwargs))
+
+        pending, error = set(futures), None
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                break  # deadline
+            for future in done:
+                if future.exception() is None:
+                    if future is not futures[0]:
+                        LLM_CALLS.increment(self.agent_name, "hedge_wins")
+                    LLM_CALLS.record_latency(self.agent_name, time.monotonic() - start)
+                    for other in pending:
+                        other.add_done_callback(lambda f: self._log_wasted(messages, f, quota_scope))
+                    return future.result()
+                error = error or future.exception()
+
+        if error is not None and not pending:
+            raise error
+        LLM_CALLS.increment(self.agent_name, "timeouts")
+        for other in pending:
+            other.add_done_callback(lambda f: self._log_wasted(messages, f, quota_scope))
+        raise TimeoutError(f"{self.agent_name}: no LLM answer before the deadline")
+
+    def _log_wasted(self, messages: list[list[BaseMessage]], future, quota_scope: tuple):
+        """
+        Tokens of a request whose answer was not used (hedge loser / past the deadline) still cost money:
+        charged to the caller's quota_scope (see get_quota_scope), and logged per batch item.
+        """
+        if future.cancelled() or future.exception() is not None:
+            return
+        response = future.result()
+        token_usage = (response.llm_output or {}).get("token_usage", {})
+        prompt_tokens = token_usage.get("prompt_tokens") or 0
+        completion_tokens = token_usage.get("completion_tokens") or 0
+        LLM_CALLS.increment(self.agent_name, "wasted_tokens", prompt_tokens + completion_tokens)
+        charge_tokens(prompt_tokens + completion_tokens, quota_scope)
+        for idx, message_list in enumerate(messages):
+            self._log_item(f"{self.agent_name}{LLM_HEDGE_WASTED_SUFFIX}", message_list,
+                           str(response.generations[idx][0].text), prompt_tokens, completion_tokens)
+
+    def _open_stream(self, message_dicts: List[dict], params: dict, deadline: float):
+        """Open a completion stream, asking for the token usage when the API supports it."""
+        global _STREAM_USAGE_SUPPORTED
+        timeout = max(0.0, deadline - time.monotonic())
+        if _STREAM_USAGE_SUPPORTED:
+            try:
+                return self.client.create(messages=message_dicts, stream_options={"include_usage": True},
+                                          timeout=timeout, **params)
+            except BadRequestError as e:
+                _STREAM_USAGE_SUPPORTED = False
+                logger.warning(f"Streamed token usage is not supported ({e}), counting tokens locally.")
+        return self.client.create(messages=message_dicts, timeout=max(0.0, deadline - time.monotonic()), **params)
+
+    def stream_tokens(self, messages: List[BaseMessage]) -> Iterator[str]:
+        """
+        Yield the answer to messages token by token, as the tokens arrive.
+        Token usage is logged once the stream ends: taken from the final usage chunk of the API, or counted
+        locally when the API version does not send it. Cached answers (see use_response_cache) are yielded at once.
+        """
+        cache_key = None
+        if self.use_response_cache and self.temperature == 0:
+            cache_key = self._response_cache_key(messages, {})
+            cached = get_response_cache().get_many(self.agent_name, [cache_key])
+            if cache_key in cached:
+                answer = str(cached[cache_key][0]["text"])
+                self._log_item(f"{self.agent_name}{LLM_RESPONSE_CACHE_HIT_SUFFIX}", messages, answer, 0, 0)
+                yield answer
+                return
+
+        check_quota(self.agent_name)
+        message_dicts, params = self._create_message_dicts(messages, None)
+        params = {**params, "stream": True}
+        # only opening the stream is retried: tokens already shown to the student cannot be taken back
+        deadline = self._deadline()
+        stream = self._with_retries(lambda: self._open_stream(message_dicts, params, deadline), deadline)
+
+        tokens, usage = [], None
+        for chunk in stream:
+            chunk = chunk if isinstance(chunk, dict) else chunk.model_dump()
+            usage = chunk.get("usage") or usage
+            for choice in chunk.get("choices") or []:
+                token = (choice.get("delta") or {}).get("content")
+                if token:
+                    tokens.append(token)
+                    yield token
+
+        answer = "".join(tokens)
+        if usage:
+            prompt_tokens, completion_tokens = usage["prompt_tokens"], usage["completion_tokens"]
+            PROMPT_ESTIMATES.record(self.agent_name, count_message_tokens(messages), prompt_tokens)
+        else:
+            prompt_tokens, completion_tokens = count_message_tokens(messages), count_tokens(answer)
+        self._log_item(self.agent_name, messages, answer, prompt_tokens, completion_tokens)
+        charge_tokens(prompt_tokens + completion_tokens)
+        if cache_key is not None:
+            get_response_cache().put(self.agent_name, cache_key, [{"text": answer, "generation_info": None}])
+
+
+# --- model registry ---
+_CHAT_MODELS = {}
+_CHAT_MODELS_LOCK = threading.Lock()
+
+def _create_chat_client():
+    """
+    Sync chat completions client on the shared connection pool.
+    Built here, not through AzureChatOpenAI(http_client=...): langchain_community passes that client to
+    AsyncAzureOpenAI too, which rejects a sync httpx.Client.
+    """
+    return AzureOpenAI(
+        azure_deployment=CHAT_DEPLOYMENT_NAME,
+        api_version=API_VERSION,
+        azure_endpoint=AZURE_OPENAI_ENDPOINT,
+        api_key=get_api_key(),
+        max_retries=0,  # retries are done by LoggingAzureChatOpenAI within the agent's deadline
+        timeout=LLM_HTTP_TIMEOUT_SECONDS,
+        http_client=get_http_client(),
+    ).chat.completions
+
+def get_chat_model(agent_name: str, **params) -> LoggingAzureChatOpenAI:
+    """
+    Return the chat model of an agent, creating it on first use.
+    All models share the HTTP connection pool of get_http_client() and differ only in agent_name and
+    call parameters (temperature=0 unless given, any other LoggingAzureChatOpenAI field can be overridden).
+    Call resilience (deadline, retries, hedging) is configured per agent_name, see LLM_DEADLINES_SECONDS.
+    """
+    # retries are done by LoggingAzureChatOpenAI within the agent's deadline, not by the OpenAI client
+    params = {"temperature": 0, "max_retries": 0, **params}
+    key = (agent_name, tuple(sorted((name, repr(value)) for name, value in params.items())))
+    if key not in _CHAT_MODELS:
+        with _CHAT_MODELS_LOCK:
+            if key not in _CHAT_MODELS:
+                model = LoggingAzureChatOpenAI(
+                    agent_name=agent_name,
+                    azure_deployment=CHAT_DEPLOYMENT_NAME,
+                    azure_endpoint=AZURE_OPENAI_ENDPOINT,
+                    openai_api_version=API_VERSION,
+                    openai_api_type="azure",
+                    request_timeout=LLM_HTTP_TIMEOUT_SECONDS,
+                    **({"openai_api_key": get_api_key()} if LLM_CASSETTE_MODE == CASSETTE_REPLAY else {}),
+                    **params,
+                )
+                # sync calls (generate, stream_tokens) go through the shared pool; the async client keeps its own
+                model.client = _create_chat_client()
+                _CHAT_MODELS[key] = model
+    return _CHAT_MODELS[key]
+
+
+class BaseEmbedding:
+    """
+    Embedding provider interface.
+    Subclasses implement _embed_batch; batching, concurrency and caching are shared.
+    """
+    model_name: str = ""
+
+    def __init__(self, use_cache: bool = EMBEDDING_CACHE_ENABLED):
+        self.cache = None
+        if use_cache:
+            cache_path = EMBEDDING_CACHE_PATH or get_cache_folder() / "embeddings_cache.sqlite"
+            self.cache = EmbeddingCache(cache_path, max_entries=EMBEDDING_CACHE_MAX_ENTRIES)
+
+    @staticmethod
+    def _estimate_tokens(text: str) -> int:
+        """Rough token estimate (~4 characters per token) used only for packing batches."""
+        return len(text) // 4 + 1
+
+    def _iter_batches(self, texts: List[str], max_items: int, max_tokens: int):
+        """
+        Split texts into consecutive batches bounded by max_items and (estimated) max_tokens.
+        A single text larger than max_tokens is sent alone.
+        """
+        batch, batch_tokens = [], 0
+        for text in texts:
+            n_tokens = self._estimate_tokens(text)
+            if batch and (len(batch) >= max_items or batch_tokens + n_tokens > max_tokens):
+                yield batch
+                batch, batch_tokens = [], 0
+            batch.append(text)
+            batch_tokens += n_tokens
+        if batch:
+            yield batch
+
+    def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        """Embed a batch of texts, keeping the input order."""
+        raise NotImplementedError
+
+    def _embed_uncached(self, texts: List[str], max_items: int, max_tokens: int, max_workers: int) -> List[List[float]]:
+        """Embed the batches with up to max_workers requests in flight; results keep the input order."""
+        batches = list(self._iter_batches(texts, max_items, max_tokens))
+        embeddings = []
+        with tqdm(total=len(texts), desc="Generating embeddings", disable=(not DEBUG_MODE)) as pbar:
+            if max_workers <= 1 or len(batches) == 1:
+                for batch in batches:
+                    embeddings.extend(self._embed_batch(batch))
+                    pbar.update(len(batch))
+            else:
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    futures = [executor.submit(self._embed_batch, batch) for batch in batches]
+                    for batch, future in zip(batches, futures):
+                        embeddings.extend(future.result())
+                        pbar.update(len(batch))
+        return embeddings
+
+    def embed(self, texts: List[str], max_items: int = EMBEDDING_BATCH_MAX_ITEMS, max_tokens: int = EMBEDDING_BATCH_MAX_TOKENS,
+              max_workers: int = EMBEDDING_MAX_CONCURRENCY):
+        """
+        Embed texts, packing many inputs into a single request.
+        Texts found in the embedding cache are not sent to the provider.
+
+        Args:
+            texts (List[str]): Texts to embed.
+            max_items (int): Max number of inputs per request (1 = one request per text).
+            max_tokens (int): Max (estimated) number of input tokens per request.
+            max_workers (int): Max number of requests sent concurrently.
+
+        Returns:
+            (embeddings, dim): list of vectors aligned with texts, and the vectors dimension.
+        """
+        texts = [str(text) for text in texts]
+        if self.cache is None:
+            embeddings = self._embed_uncached(texts, max_items, max_tokens, max_workers)
+        else:
+            vectors = self.cache.get_many(self.model_name, texts)
+            missing = [text for text in dict.fromkeys(texts) if text not in vectors]
+            if missing:
+                new_vectors = dict(zip(missing, self._embed_uncached(missing, max_items, max_tokens, max_workers)))
+                self.cache.put_many(self.model_name, new_vectors)
+                vectors.update(new_vectors)
+            embeddings = [vectors[text] for text in texts]
+
+        dim = len(embeddings[0]) if embeddings else 0
+        return embeddings, dim
+
+    def cache_stats(self) -> dict:
+        return self.cache.stats() if self.cache is not None else {}
+
+
+class LoggingEmbedding(BaseEmbedding):
+    """Azure OpenAI embeddings, with token usage logged per request."""
+    model_name = EMBEDDING_MODEL
+
+    def __init__(self, use_cache: bool = EMBEDDING_CACHE_ENABLED):
+        super().__init__(use_cache=use_cache)
         self.client = AzureOpenAI(
             azure_deployment=EMBEDDING_DEPLOYMENT_NAME,
             api_version=API_VERSION,
             azure_endpoint=AZURE_OPENAI_ENDPOINT,
-            api_key=os.getenv("OPENAI_API_KEY"),
+            api_key=get_api_key(),
+            max_retries=0,  # retries are handled in _create_with_retries
+            http_client=get_http_client(),
         )
 
-    def embed(self, texts: List[str]):
-        embeddings = []
-        for text in tqdm(texts, desc="Generating embeddings", disable=(not DEBUG_MODE)):
-            resp = self.client.embeddings.create(input=text, model=EMBEDDING_MODEL)
-            embedding_vec = resp.data[0].embedding
-            embeddings.append(embedding_vec)
+    def _create_with_retries(self, batch: List[str]):
+        for attempt in range(EMBEDDING_MAX_RETRIES + 1):
+            try:
+                return self.client.embeddings.create(input=batch, model=EMBEDDING_MODEL)
+            except Exception as e:
+                if not is_retryable_error(e) or attempt == EMBEDDING_MAX_RETRIES:
+                    raise
+                delay = get_retry_delay(e, attempt)
+                logger.warning(f"Embedding request failed ({e.__class__.__name__}), retry {attempt + 1} in {delay:.1f}s")
+                time.sleep(delay)
 
-            input_tokens = resp.usage.prompt_tokens
-            log_token_count_to_csv("Embedded", text, "Vector", input_tokens, 0)
+    def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        """Embed a batch of texts in a single request, keeping the input order."""
+        resp = self._create_with_retries(batch)
+        vectors = [item.embedding for item in sorted(resp.data, key=lambda item: item.index)]
 
-        dim = len(embeddings[0]) if embeddings else 0
-        return embeddings, dim
+        input_tokens = resp.usage.prompt_tokens
+        log_token_count_to_csv("Embedded", "\n".join(batch), f"{len(batch)} Vectors", input_tokens, 0)
+        return vectors
+
+
+class HashingEmbedding(BaseEmbedding):
+    """
+    Local, network-free embeddings using the hashing trick over word unigrams and character n-grams.
+    Deterministic across processes, so vectors can be indexed and searched offline.
+    """
+
+    def __init__(self, dim: int = EMBEDDING_DIM, ngram_range: tuple = (3, 5), use_cache: bool = EMBEDDING_CACHE_ENABLED):
+        self.dim = dim
+        self.ngram_range = ngram_range
+        self.model_name = f"hashing-ngram-{ngram_range[0]}-{ngram_range[1]}-{dim}"
+        super().__init__(use_cache=use_cache)
+
+    def _features(self, text: str):
+        text = " ".join(text.lower().split())
+        yield from text.split()
+        padded = f" {text} "
+        for n in range(self.ngram_range[0], self.ngram_range[1] + 1):
+            for i in range(len(padded) - n + 1):
+                yield padded[i:i + n]
+
+    def _embed_text(self, text: str) -> List[float]:
+        vec = [0.0] * self.dim
+        for feature in self._features(text):
+            h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+            # the lowest bit picks the sign, so that collisions cancel out on average
+            vec[(h >> 1) % self.dim] += 1.0 if h & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vec))
+        return [v / norm for v in vec] if norm else vec
 
+    def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        return [self._embed_text(text) for text in batch]
 
-# --- singleton instance + accessor ---
-_EMBEDDING_SINGLETON = LoggingEmbedding()
 
-def get_embedding_object():
+EMBEDDING_PROVIDERS = {
+    "azure": LoggingEmbedding,
+    "hashing": HashingEmbedding,
+}
+
+
+# --- lazy singleton instance + accessor ---
+_EMBEDDING_SINGLETON = None
+_EMBEDDING_SINGLETON_LOCK = threading.Lock()
+
+def _create_embedding_object() -> BaseEmbedding:
+    if EMBEDDING_PROVIDER not in EMBEDDING_PROVIDERS:
+        raise ValueError(f"Unknown EMBEDDING_PROVIDER '{EMBEDDING_PROVIDER}', expected one of {list(EMBEDDING_PROVIDERS)}")
+    return EMBEDDING_PROVIDERS[EMBEDDING_PROVIDER]()
+
+def get_embedding_object() -> BaseEmbedding:
+    """Return the shared embedding object, creating it on first use."""
+    global _EMBEDDING_SINGLETON
+    if _EMBEDDING_SINGLETON is None:
+        with _EMBEDDING_SINGLETON_LOCK:
+            if _EMBEDDING_SINGLETON is None:
+                _EMBEDDING_SINGLETON = _create_embedding_object()
     return _EMBEDDING_SINGLETON
 
 
+def _test_get_chat_model():
+    """
+    Smoke test: a chat model can be built (no request is sent) and uses the shared HTTP client.
+    """
+    os.environ.setdefault("OPENAI_API_KEY", "smoke-test")
+    model = get_chat_model("SMOKE_TEST")
+    assert isinstance(model, LoggingAzureChatOpenAI), f"Unexpected model type: {type(model)}"
+    assert model.client._client._client is get_http_client(), "Chat model does not use the shared HTTP client"
+    assert get_chat_model("SMOKE_TEST") is model, "Chat model is not reused"
+    print("✅ _test_get_chat_model passed.")
+
+
 if __name__ == "__main__":
+    _test_get_chat_model()
+
     # Example usage
     embeder_client = get_embedding_object()
     embeddings, dim = embeder_client.embed(["a"])
@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+import httpx
+from loguru import logger
+
+CASSETTE_OFF = "off"
+CASSETTE_RECORD = "record"  # always send, store the responses
+CASSETTE_REPLAY = "replay"  # never send, unrecorded requests fail
+CASSETTE_AUTO = "auto"  # replay what is recorded, send and record the rest
+CASSETTE_MODES = (CASSETTE_OFF, CASSETTE_RECORD, CASSETTE_REPLAY, CASSETTE_AUTO)
+
+
+class CassetteTransport(httpx.BaseTransport):
+    """
+    HTTP transport recording request / response pairs to disk and replaying them by request hash.
+
+    Sits under the OpenAI clients (chat and embeddings), so everything above it (caches, retries, token log,
+    quotas) runs unchanged. Requests are keyed by sha256 of (method, path + query, JSON body): the host and the
+    headers (API key) are not part of the key, so a cassette replays against any endpoint / key.
+    Each recording is one JSON file <key>.json in the cassette folder. Responses are recorded except for
+    rate limits (429) and server errors (5xx).
+
+    Replayed responses are delayed by latency_seconds + latency_scale * (recorded latency):
+    0 / 0 replays at full speed, 0 / 1 reproduces the recorded latencies.
+    """
+
+    def __init__(self, path: Path, mode: str = CASSETTE_AUTO, inner: Optional[httpx.BaseTransport] = None,
+                 latency_scale: float = 0.0, latency_seconds: float = 0.0):
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"Unknown cassette mode '{mode}', expected one of {CASSETTE_MODES}")
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.mode = mode
+        self.inner = inner or httpx.HTTPTransport()
+        self.latency_scale = latency_scale
+        self.latency_seconds = latency_seconds
+
+    @staticmethod
+    def request_key(request: httpx.Request) -> str:
+        try:
+            body = json.loads(request.content) if request.content else None
+        except ValueError:
+            body = request.content.decode("utf-8", errors="replace")
+        url = request.url.raw_path.decode("ascii")
+        key = json.dumps({"method": request.method, "url": url, "body": body}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def _file(self, key: str) -> Path:
+        return self.path / f"{key}.json"
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request.read()
+        key = self.request_key(request)
+
+        if self.mode in (CASSETTE_REPLAY, CASSETTE_AUTO) and self._file(key).exists():
+            return self._replay(request, key)
+        if self.mode == CASSETTE_REPLAY:
+            logger.warning(f"No recording for {request.method} {request.url.path} ({key}) in '{self.path}'")
+            # not retryable (404), so the caller fails at once
+            return httpx.Response(
+                404, request=request,
+                json={"error": {"code": "CassetteMiss", "message": f"No recording for request {key} in '{self.path}'."}},
+            )
+        return self._record(request, key)
+
+    def _replay(self, request: httpx.Request, key: str) -> httpx.Response:
+        with open(self._file(key), "r", encoding="utf-8") as f:
+            recording = json.load(f)
+        delay = self.latency_seconds + self.latency_scale * recording.get("elapsed", 0.0)
+        if delay > 0:
+            time.sleep(delay)
+        return httpx.Response(recording["status_code"], headers=recording["headers"],
+                              content=recording["body"].encode("utf-8"), request=request)
+
+    def _record(self, request: httpx.Request, key: str) -> httpx.Response:
+        start = time.monotonic()
+        response = self.inner.handle_request(request)
+        try:
+            body = response.read()  # decoded; a streamed (SSE) body is recorded whole
+        finally:
+            response.close()
+        elapsed = time.monotonic() - start
+        # the body is stored decoded, so the encoding / length headers no longer apply
+        headers = {name: value for name, value in response.headers.items()
+                   if name.lower() not in ("content-encoding", "content-length", "transfer-encoding")}
+
+        # client errors are part of the conversation (e.g. a rejected stream_options makes stream_tokens fall back)
+        # and are replayed; rate limits and server errors are transient and are not recorded
+        if response.status_code != 429 and response.status_code < 500:
+            self._write(key, {
+                "request": {"method": request.method, "url": request.url.raw_path.decode("ascii"),
+                            "body": request.content.decode("utf-8", errors="replace")},
+                "status_code": response.status_code,
+                "headers": headers,
+                "body": body.decode("utf-8", errors="replace"),
+                "elapsed": round(elapsed, 3),
+            })
+        return httpx.Response(response.status_code, headers=headers, content=body, request=request)
+
+    def _write(self, key: str, recording: dict) -> None:
+        # written to a temporary file and renamed: concurrent (e.g. hedged) identical requests never mix
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(recording, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self._file(key))
+
+    def close(self) -> None:
+        self.inner.close()
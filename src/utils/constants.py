@@ -19,11 +19,113 @@ PRICE_4o_1M_INPUT_TOKENS = 2.5
 PRICE_4o_1M_OUTPUT_TOKENS = 10
 
 PRICE_EMBED_SMALL_1M_INPUT_TOKENS = 0.02
-EMBEDDING_DIM = 1536
+
+# HTTP connection pool shared by all LLM / embedding clients (keep-alive connections to the Azure endpoint)
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "20"))
+LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS", "10"))
+LLM_HTTP_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY_SECONDS", "60"))
+LLM_HTTP_TIMEOUT_SECONDS = float(os.getenv("LLM_HTTP_TIMEOUT_SECONDS", "60"))
+LLM_HTTP_CONNECT_TIMEOUT_SECONDS = float(os.getenv("LLM_HTTP_CONNECT_TIMEOUT_SECONDS", "10"))
+
+# Prompt budgets: prompts are measured locally before sending and their lowest-priority sections are trimmed
+PROMPT_TOKENIZER_ENCODING = "o200k_base"  # tiktoken encoding of the chat model (gpt-4o)
+PROMPT_TOKEN_BUDGETS = {  # max tokens of the prompts built by each agent (see LLM_utils.build_prompt)
+    "MAIN_PRIVATE_AGENT": 2000,
+    "GENERATE_QUESTION": 1500,
+    "HAND_IN_HAND": 1500,
+}
+PROMPT_TOKEN_BUDGET_DEFAULT = 4000
+
+# Token quotas (0 = unlimited): close to a quota, agents switch to cheaper paths; over it, LLM calls are refused
+SESSION_TOKEN_QUOTA = int(os.getenv("SESSION_TOKEN_QUOTA", "150000"))  # per lesson
+STUDENT_DAILY_TOKEN_QUOTA = int(os.getenv("STUDENT_DAILY_TOKEN_QUOTA", "500000"))  # per student per (UTC) day
+QUOTA_DEGRADE_RATIO = 0.8  # share of a quota from which the cheaper paths are used
+QUOTA_DEGRADED_CONTEXT_RATIO = 0.5  # prompt budgets are scaled by this when degraded
+
+# LLM call resilience: per-agent deadlines (whole call, retries included), jittered retries and hedged requests
+LLM_DEADLINES_SECONDS = {
+    "COACHER": 20,
+    "ANSWER_EVALUATOR": 30,
+    "GENERATE_QUESTION": 30,
+    "STUDENT_EVALUATOR": 45,
+    "FINAL_FEEDBACK": 45,
+    "HAND_IN_HAND": 60,
+    "MAIN_PRIVATE_AGENT": 60,
+}
+LLM_DEADLINE_SECONDS_DEFAULT = 60
+LLM_MAX_RETRIES = 3
+LLM_BACKOFF_BASE_SECONDS = 0.5
+LLM_BACKOFF_MAX_SECONDS = 8.0
+# hedging: if no answer after the agent's p95 latency, send a duplicate request and take the first answer
+LLM_HEDGING_ENABLED = os.getenv("LLM_HEDGING_ENABLED", "0") == "1"
+LLM_HEDGE_PERCENTILE = 0.95
+LLM_HEDGE_MIN_SAMPLES = 20  # latencies needed before an agent's requests are hedged
+LLM_HEDGE_WASTED_SUFFIX = " (hedge wasted)"  # appended to the agent name of losing requests in the token log
+
+# Streaming: student-facing LLM messages (coacher, final feedback) are rendered token by token
+LLM_STREAMING_ENABLED = os.getenv("LLM_STREAMING_ENABLED", "1") == "1"
+# ask the API for the token usage at the end of a stream (needs an API version supporting stream_options);
+# otherwise / when rejected, the streamed tokens are counted locally
+LLM_STREAM_USAGE = os.getenv("LLM_STREAM_USAGE", "1") == "1"
+
+# Token log: rows are written by a background thread, in batches
+TOKEN_LOG_FLUSH_ROWS = 100  # write as soon as this many rows are pending
+TOKEN_LOG_FLUSH_INTERVAL_SECONDS = 2.0  # ... or at least this often
+
+# Record / replay of LLM and embedding HTTP requests (see src/utils/cassette.py)
+LLM_CASSETTE_MODE = os.getenv("LLM_CASSETTE_MODE", "off")  # "off" | "record" | "replay" | "auto"
+LLM_CASSETTE_PATH = os.getenv("LLM_CASSETTE_PATH")  # default: <repo>/cassettes/default
+LLM_CASSETTE_LATENCY_SCALE = float(os.getenv("LLM_CASSETTE_LATENCY_SCALE", "0"))  # 1 = recorded latencies
+LLM_CASSETTE_LATENCY_SECONDS = float(os.getenv("LLM_CASSETTE_LATENCY_SECONDS", "0"))  # added to every replay
+
+# LLM response cache (opt-in): identical temperature=0 requests are answered from a local SQLite cache
+# (forced off with a cassette: which requests are sent must not depend on the contents of cache/)
+LLM_RESPONSE_CACHE_ENABLED = LLM_CASSETTE_MODE == "off" and os.getenv("LLM_RESPONSE_CACHE_ENABLED", "0") == "1"
+LLM_RESPONSE_CACHE_PATH = os.getenv("LLM_RESPONSE_CACHE_PATH")  # default: <repo>/cache/llm_responses_cache.sqlite
+LLM_RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("LLM_RESPONSE_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+LLM_RESPONSE_CACHE_MAX_ENTRIES = 50_000
+LLM_RESPONSE_CACHE_HIT_SUFFIX = " (cache hit)"  # appended to the agent name of cached rows in the token log
+
+# Embeddings
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "azure")  # "azure" | "hashing" (local, no network)
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "1536"))  # used by the local provider
+EMBEDDING_BATCH_MAX_ITEMS = 256  # max inputs per embeddings request
+EMBEDDING_BATCH_MAX_TOKENS = 8000  # max (estimated) input tokens per embeddings request
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))  # parallel embeddings requests
+EMBEDDING_MAX_RETRIES = 6  # retries on 429 / 5xx / connection errors
+EMBEDDING_BACKOFF_BASE_SECONDS = 1.0
+EMBEDDING_BACKOFF_MAX_SECONDS = 60.0
+# off with a cassette (see LLM_CASSETTE_MODE), so that recordings replay on any machine
+EMBEDDING_CACHE_ENABLED = LLM_CASSETTE_MODE == "off" and os.getenv("EMBEDDING_CACHE_ENABLED", "1") == "1"
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH")  # default: <repo>/cache/embeddings_cache.sqlite
+EMBEDDING_CACHE_MAX_ENTRIES = 200_000
 
 # QDRANT DB
 QDRANT_CLUSTER_URL = "https://23beef8e-a598-4086-8a43-360a6973c7e3.us-west-2-0.aws.cloud.qdrant.io:6333"
 QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
+# "cloud" (QDRANT_CLUSTER_URL), "memory" (in-process, not persisted) or "local" (in-process, persisted to QDRANT_LOCAL_PATH)
+DB_BACKEND = os.getenv("DB_BACKEND", "cloud")
+QDRANT_LOCAL_PATH = os.getenv("QDRANT_LOCAL_PATH")  # default: <repo>/cache/qdrant_local
+# search all courses in the single "questions" collection with a course filter (see build_unified_questions_collection)
+USE_UNIFIED_QUESTIONS_COLLECTION = os.getenv("USE_UNIFIED_QUESTIONS_COLLECTION", "0") == "1"
+SEARCH_CACHE_MAX_ENTRIES = 2048  # cached search results (LRU)
+SEARCH_CACHE_TTL_SECONDS = 600
+# rows embedded and upserted together by index_df: one full embeddings batch per parallel worker, so that
+# chunks of short texts still keep all EMBEDDING_MAX_CONCURRENCY requests busy
+INDEX_CHUNK_SIZE = EMBEDDING_BATCH_MAX_ITEMS * EMBEDDING_MAX_CONCURRENCY
+UPSERT_BATCH_SIZE = 256  # points per upsert request
+
+# Students
+# "qdrant" (points of the students_db collection) or "sqlite" (local SQLite DB at STUDENTS_SQLITE_PATH)
+STUDENT_STORE_BACKEND = os.getenv("STUDENT_STORE_BACKEND", "qdrant")
+STUDENTS_SQLITE_PATH = os.getenv("STUDENTS_SQLITE_PATH")  # default: <repo>/local_db/students.sqlite
+MASTERY_EMA_ALPHA = 0.3  # weight of the latest score in the running mastery score
+MASTERY_LAST_NOTES = 3  # notes kept in the student's course summary
+MASTERY_TOP_WEAK_TOPICS = 5  # weak topics shown in the student's course summary
+MASTERY_SUMMARY_MAX_ATTEMPTS = 8  # compare-and-set attempts of a summary update racing other sessions
+MASTERY_SUMMARY_APPLIED_KEYS = 16  # last writes recorded in a summary, to check an update was applied
+STUDENTS_BULK_CHUNK_SIZE = 500  # students / status entries written per request by the bulk import
+STUDENTS_BULK_MAX_WORKERS = int(os.getenv("STUDENTS_BULK_MAX_WORKERS", "4"))  # parallel bulk writes
 
 # Course
 VALID_COURSES = ["Math", "History", "Science", "SAT"]
@@ -12,4 +12,12 @@ def get_repo_folder():
     raise FileNotFoundError("Repository folder 'PrivateTeacherAgent' not found.")
 
 def get_token_count_file_path():
-    return get_repo_folder() / os.path.join('tokens_count','total_tokens.csv')
\ No newline at end of file
+    return get_repo_folder() / os.path.join('tokens_count','total_tokens.csv')
+
+def get_cache_folder():
+    return get_repo_folder() / 'cache'
+
+def get_local_db_folder():
+    folder = get_repo_folder() / 'local_db'
+    folder.mkdir(exist_ok=True)
+    return folder
@@ -0,0 +1,112 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List
+
+from loguru import logger
+
+
+class ResponseCache:
+    """
+    Persistent cache of deterministic (temperature=0) LLM responses.
+
+    Responses are stored as JSON in a SQLite file, keyed by sha256 of (deployment, messages, params).
+    Entries expire after ttl seconds; the cache is bounded by max_entries, least recently used entries
+    are evicted first. Hits / misses are counted per agent.
+    """
+
+    def __init__(self, path: Path, max_entries: int = 50_000, ttl: float = 7 * 24 * 3600):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = defaultdict(int)
+        self.misses = defaultdict(int)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, agent_name TEXT, response TEXT, created_at REAL, last_access REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(deployment: str, messages: List[Dict[str, Any]], params: Dict[str, Any]) -> str:
+        request = json.dumps({"deployment": deployment, "messages": messages, "params": params},
+                             sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(request.encode("utf-8")).hexdigest()
+
+    def get_many(self, agent_name: str, keys: List[str]) -> Dict[str, Any]:
+        """Return {key: response} for the keys found (and not expired), and refresh their access time."""
+        found = {}
+        now = time.time()
+        with self._lock:
+            unique_keys = list(dict.fromkeys(keys))
+            rows = self._conn.execute(
+                f"SELECT key, response FROM responses WHERE key IN ({','.join('?' * len(unique_keys))}) "
+                "AND created_at > ?",
+                [*unique_keys, now - self.ttl],
+            ).fetchall()
+            for key, response in rows:
+                found[key] = json.loads(response)
+
+            self._conn.executemany("UPDATE responses SET last_access = ? WHERE key = ?", [(now, key) for key in found])
+            self._conn.commit()
+
+            n_hits = sum(key in found for key in keys)
+            self.hits[agent_name] += n_hits
+            self.misses[agent_name] += len(keys) - n_hits
+        return found
+
+    def put(self, agent_name: str, key: str, response: Any) -> None:
+        """Store a response and evict expired / least recently used entries if needed."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, agent_name, response, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, agent_name, json.dumps(response, ensure_ascii=False, default=str), now, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float) -> None:
+        self._conn.execute("DELETE FROM responses WHERE created_at <= ?", (now - self.ttl,))
+        size = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        n_to_evict = size - self.max_entries
+        if n_to_evict > 0:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY last_access ASC LIMIT ?)",
+                (n_to_evict,),
+            )
+            logger.debug(f"Evicted {n_to_evict} entries from the LLM response cache.")
+
+    def size(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def stats(self) -> dict:
+        """Hits, misses and hit rate per agent, and the cache size."""
+        per_agent = {}
+        for agent_name in sorted(set(self.hits) | set(self.misses)):
+            total = self.hits[agent_name] + self.misses[agent_name]
+            per_agent[agent_name] = {
+                "hits": self.hits[agent_name],
+                "misses": self.misses[agent_name],
+                "hit_rate": (self.hits[agent_name] / total) if total else 0.0,
+            }
+        return {"agents": per_agent, "size": self.size()}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+        self.hits.clear()
+        self.misses.clear()
@@ -0,0 +1,117 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional, Tuple
+
+from loguru import logger
+
+from src.utils.constants import (
+    SESSION_TOKEN_QUOTA, STUDENT_DAILY_TOKEN_QUOTA, QUOTA_DEGRADE_RATIO
+)
+
+# the lesson / student the current LLM calls are charged to (set with quota_scope)
+_SESSION_ID = contextvars.ContextVar("quota_session_id", default=None)
+_STUDENT_ID = contextvars.ContextVar("quota_student_id", default=None)
+
+QUOTA_OK = "ok"
+QUOTA_DEGRADED = "degraded"
+QUOTA_EXCEEDED = "exceeded"
+
+
+class TokenQuotaExceeded(RuntimeError):
+    """Raised instead of sending an LLM request once the session or student quota is used up."""
+
+
+class TokenQuotas:
+    """
+    Live token usage per session (lesson) and per student and day, checked against their quotas.
+    Usage is kept in memory, per process.
+    """
+
+    def __init__(self, session_quota: int = SESSION_TOKEN_QUOTA, student_daily_quota: int = STUDENT_DAILY_TOKEN_QUOTA,
+                 degrade_ratio: float = QUOTA_DEGRADE_RATIO):
+        self.session_quota = session_quota
+        self.student_daily_quota = student_daily_quota
+        self.degrade_ratio = degrade_ratio
+        self._lock = threading.Lock()
+        self._sessions = {}  # session_id -> tokens
+        self._students = {}  # (student_id, day) -> tokens
+
+    @staticmethod
+    def _today() -> str:
+        return time.strftime("%Y-%m-%d", time.gmtime())
+
+    def charge(self, tokens: int, session_id: Optional[str], student_id: Optional[str]) -> None:
+        if not tokens:
+            return
+        with self._lock:
+            if session_id is not None:
+                self._sessions[session_id] = self._sessions.get(session_id, 0) + tokens
+            if student_id is not None:
+                key = (student_id, self._today())
+                self._students[key] = self._students.get(key, 0) + tokens
+
+    @staticmethod
+    def _usage(used: int, quota: int) -> dict:
+        return {"used": used, "quota": quota or None, "ratio": round(used / quota, 4) if quota else 0.0}
+
+    def state(self, session_id: Optional[str], student_id: Optional[str]) -> dict:
+        """Usage of the session and of the student today, and the resulting level: ok | degraded | exceeded."""
+        with self._lock:
+            session = self._usage(self._sessions.get(session_id, 0), self.session_quota)
+            student = self._usage(self._students.get((student_id, self._today()), 0), self.student_daily_quota)
+        ratio = max(session["ratio"], student["ratio"])
+        level = QUOTA_EXCEEDED if ratio >= 1 else QUOTA_DEGRADED if ratio >= self.degrade_ratio else QUOTA_OK
+        return {"session_id": session_id, "student_id": student_id, "session": session, "student": student,
+                "level": level}
+
+    def reset_session(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+
+TOKEN_QUOTAS = TokenQuotas()
+
+
+@contextmanager
+def quota_scope(session_id: str, student_id: str = None):
+    """Charge the LLM calls made inside the block to this session and student."""
+    session_token = _SESSION_ID.set(session_id)
+    student_token = _STUDENT_ID.set(student_id)
+    try:
+        yield
+    finally:
+        _SESSION_ID.reset(session_token)
+        _STUDENT_ID.reset(student_token)
+
+
+def get_quota_scope() -> Tuple[Optional[str], Optional[str]]:
+    """(session_id, student_id) of the current quota scope, to charge tokens from another thread later."""
+    return _SESSION_ID.get(), _STUDENT_ID.get()
+
+
+def charge_tokens(tokens: int, scope: Tuple[Optional[str], Optional[str]] = None) -> None:
+    """Add tokens to the usage of the current (or the given, see get_quota_scope) session and student."""
+    session_id, student_id = scope if scope is not None else get_quota_scope()
+    TOKEN_QUOTAS.charge(tokens, session_id, student_id)
+
+
+def get_quota_state(session_id: str = None, student_id: str = None) -> dict:
+    """Quota state of the given (by default: the current) session and student."""
+    return TOKEN_QUOTAS.state(session_id or _SESSION_ID.get(), student_id or _STUDENT_ID.get())
+
+
+def is_quota_degraded() -> bool:
+    """True when the current session or student is close to (or over) its quota: use the cheaper paths."""
+    return get_quota_state()["level"] != QUOTA_OK
+
+
+def check_quota(agent_name: str) -> None:
+    """Raise TokenQuotaExceeded if the current session or student has used up its quota."""
+    state = get_quota_state()
+    if state["level"] == QUOTA_EXCEEDED:
+        logger.warning(f"{agent_name}: token quota exceeded {state}")
+        raise TokenQuotaExceeded(
+            f"Token quota exceeded (session {state['session']}, student {state['student']})."
+        )
@@ -1,21 +1,122 @@
+import atexit
 import csv
-from src.utils.folders_utils import get_token_count_file_path
+import io
+import os
+import queue
+import threading
 import time
 
+from loguru import logger
+from src.utils.constants import TOKEN_LOG_FLUSH_ROWS, TOKEN_LOG_FLUSH_INTERVAL_SECONDS
+from src.utils.folders_utils import get_token_count_file_path
+
+try:
+    import fcntl  # POSIX only: serializes appends of several processes
+except ImportError:
+    fcntl = None
+
+
+class TokenLogWriter:
+    """
+    Background writer of the token log.
+
+    Rows are put on a queue by the callers and appended to the CSV by a daemon thread, in batches:
+    when flush_rows rows are pending, every flush_interval seconds, and at interpreter exit.
+    Each batch is a single write under an exclusive file lock, so rows of several processes never interleave.
+    """
+
+    def __init__(self, flush_rows: int = TOKEN_LOG_FLUSH_ROWS, flush_interval: float = TOKEN_LOG_FLUSH_INTERVAL_SECONDS):
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self._path = None
+        self._reset()
+        atexit.register(self.flush)
+        if hasattr(os, "register_at_fork"):
+            # the writer thread does not survive a fork; the child starts its own
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._queue = queue.SimpleQueue()
+        self._wake = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    @property
+    def path(self):
+        # resolved once: get_token_count_file_path walks up the directory tree
+        if self._path is None:
+            self._path = get_token_count_file_path()
+        return self._path
+
+    def log(self, row: list):
+        self._queue.put(row)
+        if self._thread is None:
+            self._start()
+        if self._queue.qsize() >= self.flush_rows:
+            self._wake.set()
+
+    def _start(self):
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="token-log-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning(f"Failed to write the token log: {e}")
+
+    def flush(self):
+        """Write all pending rows now (called at exit; also useful before reading the CSV)."""
+        # the lock also makes an exit-time flush wait for a batch being written by the thread
+        with self._flush_lock:
+            rows = []
+            while True:
+                try:
+                    rows.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if rows:
+                self._write(rows)
+
+    def _write(self, rows: list):
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator="\n").writerows(rows)
+        with open(self.path, mode="a", newline="", encoding='utf-8-sig') as file:
+            if fcntl is not None:
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+            try:
+                file.write(buffer.getvalue())
+                file.flush()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+
+_TOKEN_LOG_WRITER = TokenLogWriter()
+
 
 def log_token_count_to_csv(agent_name, prompt, generated_answer, prompt_tokens, completion_tokens):
     """
-    Extracts token usage from an LLM response and appends it to a CSV file.
+    Queues a row with the token usage of an LLM / embedding call for the token log CSV.
 
     The CSV file will store the number of prompt (input) and completion (output) tokens used.
+    Rows are written in the background (see TokenLogWriter); call flush_token_log() to write them immediately.
     """
     date_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
 
-    with open(get_token_count_file_path(), mode="a", newline="", encoding='utf-8-sig') as file:
-        writer = csv.writer(file, lineterminator="\n")
-        # dont save the whole prompt, but only the first 1000 characters
-        prompt = prompt[:1000]
-        # dont save the whole generated answer, but only the first 1000 characters
-        generated_answer = generated_answer[:1000]
-    
-        writer.writerow([date_time, agent_name, prompt, generated_answer, prompt_tokens, completion_tokens])
+    # dont save the whole prompt, but only the first 1000 characters
+    prompt = prompt[:1000]
+    # dont save the whole generated answer, but only the first 1000 characters
+    generated_answer = generated_answer[:1000]
+
+    _TOKEN_LOG_WRITER.log([date_time, agent_name, prompt, generated_answer, prompt_tokens, completion_tokens])
+
+
+def flush_token_log():
+    _TOKEN_LOG_WRITER.flush()
@@ -1,19 +1,41 @@
+from typing import Iterator, Union
 
 
-def present_message_to_user(message: str) -> str:
+def _render(message: Union[str, Iterator[str]]) -> str:
+    """
+    Print a message; a token iterator (e.g. LoggingAzureChatOpenAI.stream_tokens) is printed as the tokens arrive.
+    Returns the full message text.
+    """
+    if not isinstance(message, Iterator):
+        message = str(message)
+        print(message.replace("\\n", "\n"))
+        return message
+    tokens = []
+    for token in message:
+        print(token, end="", flush=True)
+        tokens.append(token)
+    print()
+    return "".join(tokens)
+
+def display_message(message: Union[str, Iterator[str]], header: str = "📚🤖 AI Teacher:") -> str:
+    """Display a message (or a stream of tokens) to the student without waiting for a reply. Returns the text."""
+    print(f"\n\n{header}")
+    return _render(message)
+
+def present_message_to_user(message: Union[str, Iterator[str]]) -> str:
     """
     Tool Name: Present Message to User
     Description:
         Displays a message to the student.
 
     Args:
-        message (str): The message to display to the student.
+        message (str): The message to display to the student (or an iterator of its tokens, shown as they arrive).
 
     Returns:
         Student reply (could be also empty and then you should continue lead the conversation)
     """
     print("\n\n📚🤖 AI Teacher:") 
-    print(str(message).replace("\\n", "\n"))
+    _render(message)
     return str(input("\n🎓 Student: "))
 
 def get_student_response(message):
@@ -25,13 +47,13 @@ def get_student_response(message):
         where the AI tutor presents the message to the student and collects their response.
 
     Args:
-        message_to_student (str): The message to present to the student.
+        message_to_student (str): The message to present to the student (or an iterator of its tokens).
 
     Returns:
         str: The student's response as plain text.
     """
     print("\n\n📚🤖 AI Teacher:\t")
-    print(str(message).replace("\\n", "\n"))
+    _render(message)
     return str(input("\n🎓 Student: "))
 
 if __name__ == "__main__":
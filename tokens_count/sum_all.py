@@ -22,6 +22,15 @@ total_input_not_embedded = not_embedded_df["input tokens"].sum()
 total_output_not_embedded = not_embedded_df["output tokens"].sum()
 print(f"Not Embedding \n Total input tokens: {total_input_not_embedded} \n Total output tokens: {total_output_not_embedded}")
 
+# rows answered from the LLM response cache (0 tokens) are logged as '<agent_name> (cache hit)'
+CACHE_HIT_SUFFIX = " (cache hit)"
+is_cache_hit = not_embedded_df['agent_name'].str.endswith(CACHE_HIT_SUFFIX)
+agent_names = not_embedded_df['agent_name'].str.removesuffix(CACHE_HIT_SUFFIX)
+cache_hits = is_cache_hit.groupby(agent_names).agg(['sum', 'count'])
+cache_hits['hit_rate'] = (cache_hits['sum'] / cache_hits['count']).round(3)
+cache_hits = cache_hits.rename(columns={'sum': 'cache hits', 'count': 'calls'})
+print(f"LLM response cache \n{cache_hits.to_string()}")
+
 print("\n ----- Prices -------- \n")
 
 # Prices for not embedded
@@ -49,6 +58,7 @@ with open("tokens_count/total_tokens.txt", "w") as f:
     f.write("----- Number of Tokens --------\n")
     f.write(f"Embedding \n Total input tokens: {total_input_embedded} \n Total output tokens: {total_output_embedded}\n")
     f.write(f"Not Embedding \n Total input tokens: {total_input_not_embedded} \n Total output tokens: {total_output_not_embedded}\n")
+    f.write(f"LLM response cache \n{cache_hits.to_string()}\n")
     f.write("\n----- Prices --------\n")
     f.write(f"Not Embedding - Total cost: {not_embedded_cost}\n")
     f.write(f"Embedding - Total cost: {embedded_cost}\n")